@@ -1,7 +1,8 @@
 import os
 import json
-import requests
-from typing import Dict, Any, Optional
+import asyncio
+import aiohttp
+from typing import Dict, Any, List, Optional, Tuple
 from dotenv import load_dotenv,find_dotenv
 load_dotenv(find_dotenv())
 
@@ -19,16 +20,46 @@ class D1Client:
             "Authorization": f"Bearer {self.api_token}",
             "Content-Type": "application/json",
         }
+        # Shared keep-alive session, created lazily on the running loop
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_loop = None
 
-    def execute(self, sql: str, params: list = None) -> Dict[str, Any]:
+    def _get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            self._session = aiohttp.ClientSession(
+                headers=self.headers,
+                connector=aiohttp.TCPConnector(limit=20, keepalive_timeout=60),
+            )
+            self._session_loop = loop
+        return self._session
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def execute(self, sql: str, params: list = None) -> Dict[str, Any]:
         payload = {"sql": sql}
         if params:
             payload["params"] = params
-            
-        response = requests.post(self.base_url, headers=self.headers, json=payload)
-        response.raise_for_status()
+        return await self._post(payload)
+
+    async def execute_batch(self, statements: List[Tuple[str, Optional[list]]]) -> Dict[str, Any]:
+        # Ship several statements in one request; D1 returns one result per statement
+        batch = []
+        for sql, params in statements:
+            statement = {"sql": sql}
+            if params:
+                statement["params"] = params
+            batch.append(statement)
+        return await self._post({"batch": batch})
+
+    async def _post(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        async with self._get_session().post(self.base_url, json=payload) as response:
+            response.raise_for_status()
+            data = await response.json()
         
-        data = response.json()
         if not data.get("success"):
             errors = data.get("errors", [])
             error_msg = "; ".join([e.get("message", "Unknown error") for e in errors])
@@ -36,8 +67,8 @@ class D1Client:
             
         return data
 
-    def fetch_all(self, sql: str, params: list = None) -> list:
-        data = self.execute(sql, params)
+    async def fetch_all(self, sql: str, params: list = None) -> list:
+        data = await self.execute(sql, params)
         # D1 response structure usually has 'result' which is a list of results (one per query)
         # Each result has 'results' which is the list of rows
         if not data.get("result"):
@@ -46,8 +77,8 @@ class D1Client:
         # Assuming single query execution
         return data["result"][0].get("results", [])
 
-    def fetch_one(self, sql: str, params: list = None) -> Optional[Dict[str, Any]]:
-        rows = self.fetch_all(sql, params)
+    async def fetch_one(self, sql: str, params: list = None) -> Optional[Dict[str, Any]]:
+        rows = await self.fetch_all(sql, params)
         if rows:
             return rows[0]
         return None
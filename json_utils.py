@@ -0,0 +1,37 @@
+"""
+JSON 工具函数 - 使用项目依赖 orjson，未安装时回退到标准库 json（仅作保底）
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(data):
+    """
+    解析 JSON，支持 str 和 bytes 输入
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj) -> str:
+    """
+    序列化为 JSON 字符串（非 ASCII 字符原样保留）
+    """
+    if orjson is not None:
+        return orjson.dumps(obj).decode('utf-8')
+    return json.dumps(obj, ensure_ascii=False)
+
+
+def dumps_bytes(obj) -> bytes:
+    """
+    序列化为 UTF-8 编码的 JSON 字节串（orjson 可直接输出，无需再解码）
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode('utf-8')
@@ -1,13 +1,14 @@
 from fastapi import FastAPI, HTTPException, Depends, Header, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
 from pydantic import BaseModel, HttpUrl
 from typing import Optional
 import yt_dlp
 import shutil
 from pathlib import Path
 import tempfile
-from subtitle_utils import vtt_to_json
+import json
+from subtitle_utils import vtt_to_json_async
 from cookie_utils import save_cookie_string_as_netscape, cookie_string_to_netscape
 import os
 from dotenv import load_dotenv
@@ -218,7 +219,7 @@ async def get_services_status():
             try:
                 d1_status = "connected"
                 # 简单测试D1连接
-                app.state.scheduler.d1.execute("SELECT 1")
+                await app.state.scheduler.d1.execute("SELECT 1")
             except Exception as e:
                 d1_status = f"error: {str(e)}"
                 
@@ -345,14 +346,14 @@ async def get_scheduled_tasks():
         
         # 尝试从D1数据库获取定时任务
         try:
-            tasks = scheduler.d1.fetch_all("SELECT * FROM scheduled_tasks ORDER BY createdAt DESC")
+            tasks = await scheduler.d1.fetch_all("SELECT * FROM scheduled_tasks ORDER BY createdAt DESC")
             result["scheduled_tasks"] = tasks
         except Exception as e:
             result["errors"].append(f"D1数据库scheduled_tasks查询失败: {str(e)}")
         
         # 尝试从D1数据库获取AI生成的headlines
         try:
-            headlines = scheduler.d1.fetch_all("SELECT * FROM ai_headlines ORDER BY createdAt DESC LIMIT 10")
+            headlines = await scheduler.d1.fetch_all("SELECT * FROM ai_headlines ORDER BY createdAt DESC LIMIT 10")
             result["recent_headlines"] = headlines
         except Exception as e:
             result["errors"].append(f"D1数据库ai_headlines查询失败: {str(e)}")
@@ -448,7 +449,6 @@ async def get_subtitle(request: DownloadRequest, token_valid: bool = Depends(ver
     """
     try:
         from youtube_channel_processor import get_processor
-        import json
         
         # 从URL提取video_id
         video_url = str(request.url)
@@ -470,7 +470,7 @@ async def get_subtitle(request: DownloadRequest, token_valid: bool = Depends(ver
         with processor.get_db_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                SELECT title, url, uploader, subtitle_language, subtitle_json, upload_date
+                SELECT title, url, uploader, subtitle_language, COALESCE(subtitle_blob, subtitle_json), upload_date
                 FROM videos 
                 WHERE video_id = ? AND subtitle_extracted = TRUE
             ''', (video_id,))
@@ -533,7 +533,7 @@ async def get_subtitle(request: DownloadRequest, token_valid: bool = Depends(ver
                 if not subtitle_files:
                     raise HTTPException(status_code=404, detail="未找到字幕文件")
                 
-                subtitle_json = vtt_to_json(str(subtitle_files[0]))
+                subtitle_json = (await vtt_to_json_async([subtitle_files[0]]))[0]
                 
                 # 3. 保存到数据库
                 title = info.get('title', 'Unknown')
@@ -551,15 +551,9 @@ async def get_subtitle(request: DownloadRequest, token_valid: bool = Depends(ver
                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                     ''', (video_id, channel_id, title, video_url, duration, upload_date, uploader, False, None, None))
                     
-                    cursor.execute('''
-                        UPDATE videos SET 
-                            subtitle_extracted = TRUE,
-                            subtitle_language = ?,
-                            subtitle_json = ?
-                        WHERE video_id = ?
-                    ''', (request.subtitle_lang, json.dumps(subtitle_json, ensure_ascii=False), video_id))
-                    
-                    conn.commit()
+                    processor.save_subtitles(
+                        {'language': request.subtitle_lang, 'subtitles': subtitle_json}, video_id, conn
+                    )
                 
                 logger.info(f"视频 {video_id} 字幕已保存到数据库")
                 
@@ -648,6 +642,24 @@ async def get_task_status(task_id: str, token_valid: bool = Depends(verify_any_t
         raise HTTPException(status_code=500, detail=f"获取任务状态失败: {str(e)}")
 
 
+@app.get("/api/channel_task/{task_id}/stream")
+async def stream_task_progress(task_id: str, token_valid: bool = Depends(verify_any_token)):
+    """
+    以SSE方式推送频道任务进度
+    
+    任务结束（完成/失败/取消）后自动关闭连接
+    """
+    task_manager = get_task_manager()
+    if not task_manager.get_task_status(task_id):
+        raise HTTPException(status_code=404, detail="任务不存在")
+    
+    async def event_stream():
+        async for event in task_manager.stream_progress(task_id):
+            yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
 @app.get("/api/cookie/keepalive/status")
 async def get_keepalive_status(token_valid: bool = Depends(verify_any_token)):
     """
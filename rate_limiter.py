@@ -0,0 +1,68 @@
+"""
+令牌桶限速器 - 控制对 YouTube 的请求速率
+"""
+
+import asyncio
+import os
+import threading
+import time
+from typing import Optional
+
+# 每分钟允许的 YouTube 请求数，以及允许的瞬时突发数
+YOUTUBE_REQUESTS_PER_MINUTE = int(os.getenv('YOUTUBE_REQUESTS_PER_MINUTE', '30'))
+YOUTUBE_REQUEST_BURST = 5
+
+
+class TokenBucket:
+    """
+    令牌桶：桶满时允许连续请求，之后按 rate/per 的平均速率放行
+
+    使用线程锁而不是 asyncio.Lock，可在多个线程各自的事件循环中共用同一个实例
+    """
+
+    def __init__(self, rate: float, per: float = 60.0, burst: Optional[int] = None):
+        self.capacity = float(burst or rate)
+        self.fill_rate = rate / per
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """预订一个令牌，返回需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.fill_rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.fill_rate
+
+    async def acquire(self):
+        """等待直到拿到一个令牌"""
+        delay = self._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+
+# 全局限速器实例，频道批处理和后台任务共用
+_youtube_limiter = None
+# 多个线程可能同时首次调用，加锁保证只创建一个实例
+_youtube_limiter_lock = threading.Lock()
+
+
+def get_youtube_limiter() -> TokenBucket:
+    """获取 YouTube 请求限速器（单例模式，线程安全）"""
+    global _youtube_limiter
+    if _youtube_limiter is None:
+        with _youtube_limiter_lock:
+            if _youtube_limiter is None:
+                _youtube_limiter = TokenBucket(YOUTUBE_REQUESTS_PER_MINUTE, 60.0, YOUTUBE_REQUEST_BURST)
+    return _youtube_limiter
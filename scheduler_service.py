@@ -3,17 +3,108 @@ import os
 import logging
 import uuid
 import time
-import json
-from datetime import datetime, timezone
+import hashlib
+from functools import lru_cache
+from datetime import datetime
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.cron import CronTrigger
 from openai import AsyncOpenAI
 from d1_client import D1Client
+import json_utils
 from youtube_channel_processor import get_processor
 
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Fixed instruction prefix for headline generation. Keep this byte-identical
+# across calls (no timestamps/ids) so the provider's prompt prefix cache hits.
+SYSTEM_PROMPT = (
+    "You are a helpful news editor. "
+    "Based on the video transcripts provided by the user, generate a headline and a summary article, "
+    "following any additional instructions the user gives. "
+    "Return strict JSON with keys 'title' and 'content'."
+)
+
+# Token budgets for transcripts sent to the LLM
+PER_VIDEO_TOKEN_BUDGET = 1000
+TASK_TOKEN_BUDGET = 6000
+# Immediately repeated word spans (caption stutter) up to this many words
+# are collapsed before encoding
+DEDUP_MAX_SPAN = 12
+# Rough ratio used when tiktoken isn't available
+CHARS_PER_TOKEN = 4
+# Raw transcript text read per video; anything past this can't fit the
+# per-video token budget, with headroom for n-gram dedup
+PER_VIDEO_CHAR_LIMIT = PER_VIDEO_TOKEN_BUDGET * CHARS_PER_TOKEN * 2
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(model: str):
+    """Return the tiktoken encoding for model, or None to fall back to a char estimate"""
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logger.warning(f"tiktoken encoding unavailable, using char estimate: {e}")
+        return None
+
+
+def _take_chars(parts, limit: int) -> str:
+    """Join parts with spaces, stopping once limit characters are collected"""
+    out = []
+    size = 0
+    for part in parts:
+        out.append(part)
+        size += len(part) + 1
+        if size >= limit:
+            break
+    return " ".join(out)[:limit]
+
+
+def _collapse_repeats(text: str, max_span: int = DEDUP_MAX_SPAN) -> str:
+    """Drop word spans of 2..max_span words that directly repeat the span just emitted.
+
+    Only whole back-to-back repeats are removed, so a later phrase that merely
+    shares a prefix with earlier text is kept intact.
+    """
+    source = text.split()
+    words = []
+    i = 0
+    while i < len(source):
+        for span in range(min(max_span, len(words), len(source) - i), 1, -1):
+            if source[i:i + span] == words[-span:]:
+                i += span
+                break
+        else:
+            words.append(source[i])
+            i += 1
+    return " ".join(words)
+
+
+def _truncate_tokens(text: str, limit: int, encoding) -> tuple:
+    """Truncate text to at most limit tokens, returning (text, tokens_used)"""
+    if encoding is None:
+        text = text[:limit * CHARS_PER_TOKEN]
+        return text, -(-len(text) // CHARS_PER_TOKEN)
+    tokens = encoding.encode(text)[:limit]
+    return encoding.decode(tokens), len(tokens)
+
+
+# Tasks are created/edited directly in D1, so their cron jobs are re-synced periodically
+TASK_SYNC_INTERVAL_MINUTES = 60
+TASK_JOB_PREFIX = "scheduled_task:"
+
+
 class TaskScheduler:
     def __init__(self):
         self.d1 = D1Client()
@@ -30,7 +121,7 @@ class TaskScheduler:
         """Initialize D1 tables if they don't exist"""
         logger.info("Checking D1 tables...")
         try:
-            self.d1.execute("""
+            await self.d1.execute("""
                 CREATE TABLE IF NOT EXISTS ai_headlines (
                     id text PRIMARY KEY NOT NULL,
                     userId text NOT NULL,
@@ -44,7 +135,7 @@ class TaskScheduler:
                     createdAt integer
                 );
             """)
-            self.d1.execute("""
+            await self.d1.execute("""
                 CREATE TABLE IF NOT EXISTS scheduled_tasks (
                     id text PRIMARY KEY NOT NULL,
                     userId text NOT NULL,
@@ -59,10 +150,19 @@ class TaskScheduler:
                     updatedAt integer
                 );
             """)
+            # Cron jobs replaced the hourly due-task query this index served
+            await self.d1.execute("DROP INDEX IF EXISTS idx_tasks_due;")
             logger.info("D1 tables check completed.")
         except Exception as e:
             logger.error(f"Failed to init DB: {e}")
 
+        try:
+            # Hash of the transcripts that produced the last headline
+            await self.d1.execute("ALTER TABLE scheduled_tasks ADD COLUMN lastContentHash text;")
+        except Exception:
+            # Column already exists
+            pass
+
     async def fetch_channel_subtitles(self, channel_id: str):
         """Fetch subtitles for a channel using the processor"""
         channel_url = f"https://www.youtube.com/channel/{channel_id}"
@@ -84,7 +184,14 @@ class TaskScheduler:
         for cid in channel_ids:
             await self.fetch_channel_subtitles(cid.strip())
 
-        combined_text = ""
+        # SQLite reads and subtitle trimming are blocking; keep them off the event loop
+        return await asyncio.to_thread(self._build_subtitles_text, channel_ids)
+
+    def _build_subtitles_text(self, channel_ids: list) -> str:
+        """Read recent subtitles from the local DB and trim them to the token budget"""
+        parts = []
+        encoding = _get_encoding(os.getenv("OPENAI_MODEL") or "")
+        remaining_tokens = TASK_TOKEN_BUDGET
         
         with self.processor.get_db_connection() as conn:
             cursor = conn.cursor()
@@ -92,7 +199,7 @@ class TaskScheduler:
             # For simplicity, let's get the latest 5 videos for each channel that have subtitles
             for cid in channel_ids:
                 cursor.execute("""
-                    SELECT v.title, v.subtitle_json 
+                    SELECT v.title, COALESCE(v.subtitle_blob, v.subtitle_json) 
                     FROM videos v 
                     JOIN channels c ON v.channel_id = c.channel_id 
                     WHERE c.channel_id = ? AND v.subtitle_extracted = 1
@@ -102,33 +209,45 @@ class TaskScheduler:
                 
                 rows = cursor.fetchall()
                 for title, subtitle_json_str in rows:
+                    if remaining_tokens <= 0:
+                        break
                     if not subtitle_json_str:
                         continue
                     try:
-                        subtitles = json.loads(subtitle_json_str)
+                        subtitles = json_utils.loads(subtitle_json_str)
                         # Extract text from subtitles
-                        text = " ".join([s['subtitle'] for s in subtitles])
-                        combined_text += f"\n\nVideo: {title}\nContent: {text[:2000]}..." # Limit per video to avoid token limits
+                        text = _collapse_repeats(_take_chars(
+                            (s['subtitle'] for s in subtitles), PER_VIDEO_CHAR_LIMIT
+                        ))
+                        # Limit per video and per task to avoid token limits
+                        text, used_tokens = _truncate_tokens(
+                            text, min(PER_VIDEO_TOKEN_BUDGET, remaining_tokens), encoding
+                        )
+                        remaining_tokens -= used_tokens
+                        parts.append(f"\n\nVideo: {title}\nContent: {text}...")
                     except Exception as e:
                         logger.error(f"Error parsing subtitles for {title}: {e}")
         
-        return combined_text
+        return "".join(parts)
 
     async def generate_headline(self, content: str, prompt: str):
+        title, content, _ = await self._generate_headline(content, prompt)
+        return title, content
+
+    async def _generate_headline(self, content: str, prompt: str):
+        """Return (title, content, generated); generated is False for error and fallback text"""
         if not content:
-            return "No content available for summary.", "No content"
+            return "No content available for summary.", "No content", False
             
         if not self.openai:
-            return "AI Config Error", "OpenAI API Key not configured. summary generation skipped."
+            return "AI Config Error", "OpenAI API Key not configured. summary generation skipped.", False
 
-        full_prompt = f"{prompt}\n\nBased on the following video transcripts, please generate a headline and a summary article:\n\n{content}"
-        
         try:
             response = await self.openai.chat.completions.create(
                 model=os.getenv("OPENAI_MODEL"), 
                 messages=[
-                    {"role": "system", "content": "You are a helpful news editor."},
-                    {"role": "user", "content": full_prompt}
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": f"{prompt}\n\n{content}"}
                 ],
                 response_format={ "type": "json_object" }
             )
@@ -136,14 +255,14 @@ class TaskScheduler:
             result = response.choices[0].message.content
             # Expecting JSON with title and content
             try:
-                data = json.loads(result)
-                return data.get("title", "Generated Headline"), data.get("content", result)
+                data = json_utils.loads(result)
+                return data.get("title", "Generated Headline"), data.get("content", result), True
             except:
-                return "Generated Headline", result
+                return "Generated Headline", result, False
                 
         except Exception as e:
             logger.error(f"OpenAI API error: {e}")
-            return "Error generating headline", str(e)
+            return "Error generating headline", str(e), False
 
     async def run_task(self, task):
         logger.info(f"Running task {task['id']}...")
@@ -162,85 +281,153 @@ class TaskScheduler:
             logger.warning(f"No subtitles found for task {task['id']}")
             return
 
+        # Skip generation if the model input (instructions, prompt and transcripts)
+        # is identical to the last run's
+        content_hash = hashlib.sha1(
+            "\0".join((SYSTEM_PROMPT, prompt, content_text)).encode('utf-8')
+        ).hexdigest()
+        if task.get('lastContentHash') == content_hash:
+            logger.info(f"No new content for task {task['id']}, skipping headline generation")
+            try:
+                await self.d1.execute("""
+                    UPDATE scheduled_tasks SET lastExecutedAt = ? WHERE id = ?
+                """, [int(time.time()), task['id']])
+            except Exception as e:
+                logger.error(f"Failed to update task: {e}")
+            return
+
         # 2. Generate summary
-        title, content = await self.generate_headline(content_text, prompt)
+        title, content, generated = await self._generate_headline(content_text, prompt)
+        # Only a real headline marks this content as done; failures retry next run
+        saved_hash = content_hash if generated else task.get('lastContentHash')
         
         # 3. Save to ai_headlines
         headline_id = str(uuid.uuid4())
         created_at = int(time.time())
         
         try:
-            self.d1.execute("""
-                INSERT INTO ai_headlines (id, userId, title, content, articleCount, prompt, feedIds, createdAt)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, [
-                headline_id,
-                task['userId'],
-                title,
-                content,
-                1, # simple count
-                prompt,
-                task['feedIds'],
-                created_at
+            # 4. Update task lastExecutedAt and the content hash in the same round-trip
+            await self.d1.execute_batch([
+                ("""
+                    INSERT INTO ai_headlines (id, userId, title, content, articleCount, prompt, feedIds, createdAt)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, [
+                    headline_id,
+                    task['userId'],
+                    title,
+                    content,
+                    1, # simple count
+                    prompt,
+                    task['feedIds'],
+                    created_at
+                ]),
+                ("""
+                    UPDATE scheduled_tasks SET lastExecutedAt = ?, lastContentHash = ? WHERE id = ?
+                """, [created_at, saved_hash, task['id']]),
             ])
             logger.info(f"Created headline {headline_id}")
             
-            # 4. Update task lastExecutedAt
-            self.d1.execute("""
-                UPDATE scheduled_tasks SET lastExecutedAt = ? WHERE id = ?
-            """, [created_at, task['id']])
+            # The cron job holds this dict, keep it in step with D1
+            task['lastExecutedAt'] = created_at
+            task['lastContentHash'] = saved_hash
             
         except Exception as e:
             logger.error(f"Failed to save headline or update task: {e}")
 
-    async def check_schedule(self):
-        logger.info("Checking schedule...")
-        current_hour = datetime.now(timezone.utc).hour # Use UTC to be consistent
-        # Or use local time if that's what the user expects. 
-        # User metadata says "local time is ... +08:00".
-        # Let's use local time of the machine running the script.
-        current_hour_local = datetime.now().hour
+    def register_task(self, task, run_now: bool = False):
+        """Add or update the daily cron job for a task"""
+        job_id = f"{TASK_JOB_PREFIX}{task['id']}"
+        job = self.scheduler.get_job(job_id)
+        
+        # Same hour: only refresh the task data, keeping the pending fire time
+        if job and job.args[0]['scheduledHour'] == task['scheduledHour'] and not run_now:
+            job.modify(args=[task])
+            return
+        
+        job_kwargs = {'next_run_time': datetime.now()} if run_now else {}
+        self.scheduler.add_job(
+            self.run_task,
+            CronTrigger(hour=task['scheduledHour'], minute=0),
+            args=[task],
+            id=job_id,
+            replace_existing=True,
+            misfire_grace_time=3600,
+            coalesce=True,
+            **job_kwargs
+        )
+
+    def unregister_task(self, task_id: str):
+        """Remove the cron job for a deleted or deactivated task"""
+        job_id = f"{TASK_JOB_PREFIX}{task_id}"
+        if self.scheduler.get_job(job_id):
+            self.scheduler.remove_job(job_id)
+
+    async def sync_tasks(self, catch_up: bool = False):
+        """Load active tasks from D1 and keep exactly one cron job per task"""
+        logger.info("Syncing scheduled tasks...")
+        now = datetime.now()
+        hour_start = int(now.replace(minute=0, second=0, microsecond=0).timestamp())
         
         try:
-            # Fetch active tasks scheduled for this hour
-            # We also check if it was already executed recently (e.g. within the last 50 mins)
-            # to prevent double execution if the job runs multiple times in the hour.
-            # But since we run every hour, we can just check if last_executed_at is not in the current hour window.
-            
-            tasks = self.d1.fetch_all("SELECT * FROM scheduled_tasks WHERE isActive = 1")
-            
-            for task in tasks:
-                scheduled_hour = task['scheduledHour']
-                last_exec = task.get('lastExecutedAt')
-                
-                # Check if it's time to run
-                # Simple logic: if scheduled_hour matches current hour
-                if scheduled_hour == current_hour_local:
-                    # Check if already run today
-                    should_run = True
-                    if last_exec:
-                        last_exec_dt = datetime.fromtimestamp(last_exec)
-                        if last_exec_dt.date() == datetime.now().date() and last_exec_dt.hour == current_hour_local:
-                            should_run = False
-                    
-                    if should_run:
-                        await self.run_task(task)
-                        
+            tasks = await self.d1.fetch_all("""
+                SELECT id, userId, feedIds, prompt, scheduledHour, lastExecutedAt, lastContentHash
+                FROM scheduled_tasks
+                WHERE isActive = 1
+            """)
         except Exception as e:
-            logger.error(f"Error checking schedule: {e}")
+            logger.error(f"Error syncing scheduled tasks: {e}")
+            return
+        
+        active_ids = set()
+        for task in tasks:
+            active_ids.add(task['id'])
+            # On startup, run tasks whose hour is now but which haven't run in it yet
+            run_now = (
+                catch_up
+                and task['scheduledHour'] == now.hour
+                and (task.get('lastExecutedAt') or 0) < hour_start
+            )
+            try:
+                self.register_task(task, run_now=run_now)
+            except Exception as e:
+                # One bad row (e.g. scheduledHour out of range) must not block the others
+                logger.error(f"Failed to schedule task {task['id']}: {e}")
+        
+        # Tasks deleted or deactivated in D1 since the last sync
+        stale_ids = [
+            job.args[0]['id'] for job in self.scheduler.get_jobs()
+            if job.id.startswith(TASK_JOB_PREFIX) and job.args[0]['id'] not in active_ids
+        ]
+        for task_id in stale_ids:
+            self.unregister_task(task_id)
+        
+        logger.info(f"Scheduled {len(active_ids)} active tasks")
 
-    def start(self):
+    async def schedule_jobs(self):
+        """Register task cron jobs and the periodic D1 re-sync"""
+        await self.sync_tasks(catch_up=True)
+        self.scheduler.add_job(
+            self.sync_tasks,
+            'interval',
+            minutes=TASK_SYNC_INTERVAL_MINUTES,
+            id="sync_tasks",
+            replace_existing=True
+        )
+
+    async def _main(self):
         # Run init_db once
-        asyncio.get_event_loop().run_until_complete(self.init_db())
-        
-        # Add job
-        self.scheduler.add_job(self.check_schedule, 'interval', hours=1, next_run_time=datetime.now())
+        await self.init_db()
         
-        logger.info("Scheduler started. Press Ctrl+C to exit.")
+        # AsyncIOScheduler binds to the loop that is running here
         self.scheduler.start()
+        await self.schedule_jobs()
+        logger.info("Scheduler started. Press Ctrl+C to exit.")
         
+        await asyncio.Event().wait()
+
+    def start(self):
         try:
-            asyncio.get_event_loop().run_forever()
+            asyncio.run(self._main())
         except (KeyboardInterrupt, SystemExit):
             pass
 
@@ -7,7 +7,6 @@ import asyncio
 import os
 import logging
 import threading
-from datetime import datetime
 from pathlib import Path
 from contextlib import asynccontextmanager
 from dotenv import load_dotenv
@@ -64,14 +63,9 @@ async def initialize_scheduler():
         scheduler = TaskScheduler()
         await scheduler.init_db()
         
-        # 在当前事件循环中启动调度器
-        scheduler.scheduler.add_job(
-            scheduler.check_schedule, 
-            'interval', 
-            hours=1, 
-            next_run_time=datetime.now()
-        )
+        # 在当前事件循环中启动调度器，并为每个定时任务注册每日触发
         scheduler.scheduler.start()
+        await scheduler.schedule_jobs()
         
         logger.info("✅ 调度服务已启动")
         logger.info("✅ AI总结定时任务已就绪")
@@ -113,6 +107,17 @@ def create_app_lifespan():
                 logger.info("✅ 调度服务已停止")
             except Exception as e:
                 logger.error(f"⚠️ 调度服务停止时出错: {e}")
+            try:
+                await scheduler.d1.close()
+            except Exception as e:
+                logger.error(f"⚠️ D1连接关闭时出错: {e}")
+        
+        try:
+            from subtitle_utils import shutdown_process_pool
+            await asyncio.to_thread(shutdown_process_pool)
+            logger.info("✅ 字幕解析进程池已关闭")
+        except Exception as e:
+            logger.error(f"⚠️ 字幕解析进程池关闭时出错: {e}")
         
         logger.info("✅ 应用资源清理完成")
     
@@ -2,101 +2,183 @@
 字幕处理工具函数
 """
 
+import asyncio
+import mmap
+import multiprocessing
+import os
 import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from fastapi import HTTPException
 
 
-def vtt_to_json(vtt_path):
+# 字幕块：时间行（含 align/position 等设置）+ 字幕正文，直到空行或文件结尾（兼容 CRLF 换行）
+_CUE_RE = re.compile(
+    rb'(\d{2}:\d{2}:\d{2}\.\d{3}) --> (\d{2}:\d{2}:\d{2}\.\d{3})[^\r\n]*\r?\n?(.*?)(?=\r?\n\r?\n|\Z)',
+    re.DOTALL
+)
+# 空行（LF 或 CRLF），用于定位 WEBVTT 头部结束位置
+_BLANK_LINE_RE = re.compile(rb'\r?\n\r?\n')
+# 行内标签，包括 <c>、</c> 以及逐词时间戳 <00:00:01.000>
+_TAG_RE = re.compile(r'<[^>]+>')
+
+
+def _parse_vtt(vtt_path):
     """
-    将 VTT 字幕文件转换为 JSON 格式，处理重叠的时间戳并去重
+    解析 VTT 字幕文件，处理重叠的时间戳并去重（可在子进程中运行）
     """
-    try:
-        with open(vtt_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+    with open(vtt_path, 'rb') as f:
+        # 空文件无法 mmap
+        if f.seek(0, 2) == 0:
+            return []
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return _parse_vtt_buffer(mm)
+
+
+def _parse_vtt_buffer(buf):
+    """
+    解析 VTT 字幕内容（bytes 或 mmap），处理重叠的时间戳并去重（可在子进程中运行）
+    """
+    # 第一步：解析并去除完全重复的字幕
+    unique_subtitles = []
+    seen_subtitles = set()
+
+    # 跳过 WEBVTT 头部信息（第一个空行之前）
+    header_end = _BLANK_LINE_RE.search(buf)
+    start = header_end.end() if buf[:6] == b'WEBVTT' and header_end else 0
+
+    for match in _CUE_RE.finditer(buf, start):
+        start_time = match.group(1).decode('ascii')
+        end_time = match.group(2).decode('ascii')
+        # 整个字幕正文只做一次标签清理
+        body = _TAG_RE.sub('', match.group(3).decode('utf-8', 'replace'))
+
+        # 获取字幕文本（跳过 align/position 信息）
+        subtitle_text = ' '.join(
+            line for line in map(str.strip, body.split('\n'))
+            if line and not line.startswith(('align:', 'position:'))
+        )
+
+        if not subtitle_text:
+            continue
+
+        # 使用时间戳+文本作为唯一标识
+        subtitle_key = f"{start_time}_{end_time}_{subtitle_text}"
+
+        if subtitle_key in seen_subtitles:
+            continue
+
+        seen_subtitles.add(subtitle_key)
+
+        unique_subtitles.append({
+            "time": f"{start_time} --> {end_time}",
+            "start": start_time,
+            "end": end_time,
+            "subtitle": subtitle_text
+        })
 
-        # 移除 WEBVTT 头部信息
-        content = re.sub(r'^WEBVTT.*?\n\n', '', content, flags=re.DOTALL)
+    # 第二步：处理相邻字幕的重复部分
+    processed_subtitles = []
+    for i, item in enumerate(unique_subtitles):
+        current_text = item['subtitle']
 
-        # 分割成字幕块
-        blocks = re.split(r'\n\n+', content.strip())
+        if i == 0:
+            processed_subtitles.append(item)
+            continue
 
-        # 第一步：解析并去除完全重复的字幕
-        unique_subtitles = []
-        time_re = re.compile(r'(\d{2}:\d{2}:\d{2}\.\d{3}) --> (\d{2}:\d{2}:\d{2}\.\d{3})')
-        seen_subtitles = set()
+        prev_text = processed_subtitles[-1]['subtitle']
 
-        if len(blocks) > 0:
-            for block in blocks:
-                lines = block.strip().split('\n')
-                if len(lines) < 2:
-                    continue
+        if current_text in prev_text:
+            continue
 
-                # 查找时间行
-                time_match = None
-                for line in lines:
-                    match = time_re.search(line)
-                    if match:
-                        time_match = match
-                        break
+        if current_text.startswith(prev_text):
+            current_text = current_text[len(prev_text):].strip()
 
-                if not time_match:
-                    continue
+        if current_text.strip():
+            new_item = item.copy()
+            new_item['subtitle'] = current_text
+            processed_subtitles.append(new_item)
 
-                start_time, end_time = time_match.groups()
+    return processed_subtitles
 
-                # 获取字幕文本（跳过时间行和 align/position 信息）
-                subtitle_lines = []
-                for line in lines:
-                    if time_re.search(line) or 'align:' in line or 'position:' in line:
-                        continue
-                    clean_line = re.sub(r'<[^>]+>', '', line)
-                    clean_line = re.sub(r'<\d{2}:\d{2}:\d{2}\.\d{3}>', '', clean_line)
-                    if clean_line.strip():
-                        subtitle_lines.append(clean_line.strip())
 
-                subtitle_text = ' '.join(subtitle_lines).strip()
+def vtt_to_json(vtt_path):
+    """
+    将 VTT 字幕文件转换为 JSON 格式，处理重叠的时间戳并去重
+    """
+    try:
+        return _parse_vtt(vtt_path)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"转换 VTT 到 JSON 时出错: {str(e)}")
+
 
-                if not subtitle_text:
-                    continue
+def vtt_bytes_to_json(data):
+    """
+    将已读入内存的 VTT 字幕内容转换为 JSON 格式
+    """
+    try:
+        return _parse_vtt_buffer(data)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"转换 VTT 到 JSON 时出错: {str(e)}")
 
-                # 使用时间戳+文本作为唯一标识
-                subtitle_key = f"{start_time}_{end_time}_{subtitle_text}"
 
-                if subtitle_key in seen_subtitles:
-                    continue
+# 字幕解析进程数上限，解析只是辅助工作，不需要占满所有核
+SUBTITLE_PARSE_WORKERS = min(4, os.cpu_count() or 1)
 
-                seen_subtitles.add(subtitle_key)
+# 字幕解析进程池（首次使用时创建）
+_process_pool = None
+_process_pool_lock = threading.Lock()
 
-                unique_subtitles.append({
-                    "time": f"{start_time} --> {end_time}",
-                    "start": start_time,
-                    "end": end_time,
-                    "subtitle": subtitle_text
-                })
 
-        # 第二步：处理相邻字幕的重复部分
-        processed_subtitles = []
-        for i, item in enumerate(unique_subtitles):
-            current_text = item['subtitle']
+def _get_process_pool():
+    """获取字幕解析进程池（单例模式）"""
+    global _process_pool
+    if _process_pool is None:
+        with _process_pool_lock:
+            if _process_pool is None:
+                # 服务进程里有 yt-dlp、保活等线程，不能直接 fork，改由 forkserver 启动子进程
+                _process_pool = ProcessPoolExecutor(
+                    max_workers=SUBTITLE_PARSE_WORKERS,
+                    mp_context=multiprocessing.get_context("forkserver")
+                )
+    return _process_pool
 
-            if i == 0:
-                processed_subtitles.append(item)
-                continue
 
-            prev_text = processed_subtitles[-1]['subtitle']
+def shutdown_process_pool():
+    """关闭字幕解析进程池（应用退出时调用）"""
+    global _process_pool
+    with _process_pool_lock:
+        pool, _process_pool = _process_pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
 
-            if current_text in prev_text:
-                continue
 
-            if current_text.startswith(prev_text):
-                current_text = current_text[len(prev_text):].strip()
+async def vtt_to_json_async(vtt_paths):
+    """
+    在事件循环之外转换 VTT 字幕文件，按输入顺序返回每个文件的字幕列表
 
-            if current_text.strip():
-                new_item = item.copy()
-                new_item['subtitle'] = current_text
-                processed_subtitles.append(new_item)
+    单个文件在线程中解析；多个文件分发到进程池并行解析，绕开 GIL
+    """
+    try:
+        if len(vtt_paths) == 1:
+            return [await asyncio.to_thread(_parse_vtt, str(vtt_paths[0]))]
+
+        loop = asyncio.get_running_loop()
+        pool = _get_process_pool()
+        return await asyncio.gather(*[
+            loop.run_in_executor(pool, _parse_vtt, str(path)) for path in vtt_paths
+        ])
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"转换 VTT 到 JSON 时出错: {str(e)}")
 
-        return processed_subtitles
 
+async def parse_vtt_bytes_async(data: bytes):
+    """
+    在进程池中解析已读入内存的 VTT 字幕内容，避免 CPU 密集的解析占用 GIL
+    """
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_process_pool(), _parse_vtt_buffer, data)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"转换 VTT 到 JSON 时出错: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"转换 VTT 到 JSON 时出错: {str(e)}")
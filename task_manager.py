@@ -3,20 +3,45 @@
 """
 
 import asyncio
+import os
+import re
 import uuid
-import json
 import sqlite3
+import time
 from datetime import datetime
 from enum import Enum
 from typing import Dict, List, Optional
 from pathlib import Path
 import logging
-import concurrent.futures
 import threading
 from cookie_keepalive_service import get_keepalive_service
+from subtitle_utils import parse_vtt_bytes_async
+from youtube_channel_processor import get_processor
+from rate_limiter import get_youtube_limiter
+import json_utils
 
 logger = logging.getLogger(__name__)
 
+# 进度写库的最小间隔（秒），避免每个视频都提交一次
+PROGRESS_WRITE_INTERVAL = 1.0
+
+# 同时运行的批量任务数上限
+MAX_CONCURRENT_TASKS = int(os.getenv('MAX_CONCURRENT_TASKS', '4'))
+
+# 同一批量任务中同时提取字幕的视频数
+DEFAULT_EXTRACT_CONCURRENCY = 4
+
+# 字幕攒够多少个视频后批量写库
+SUBTITLE_SAVE_BATCH_SIZE = 10
+
+# 标准化不同的YouTube频道URL格式：(匹配模式, 标准化路径前缀)
+_YT_PATTERNS = (
+    (re.compile(r'youtube\.com/@([^/?]+)'), '@'),                   # @username
+    (re.compile(r'youtube\.com/c/([^/?]+)'), 'c/'),                 # /c/name
+    (re.compile(r'youtube\.com/channel/([^/?]+)'), 'channel/'),     # /channel/id
+    (re.compile(r'youtube\.com/user/([^/?]+)'), 'user/'),           # /user/name
+)
+
 class TaskStatus(Enum):
     PENDING = "pending"        # 等待中
     RUNNING = "running"        # 执行中
@@ -27,18 +52,83 @@ class TaskStatus(Enum):
 class TaskType(Enum):
     BATCH_PROCESS = "batch_process"
 
+# 预先取出枚举值，避免热路径上反复访问 Enum.value
+_STATUS_VALUES = {status: status.value for status in TaskStatus}
+_TASK_TYPE_VALUES = {task_type: task_type.value for task_type in TaskType}
+_S_PENDING = TaskStatus.PENDING.value
+_S_RUNNING = TaskStatus.RUNNING.value
+_TT_BATCH = TaskType.BATCH_PROCESS.value
+
+# update_task_status 的可选字段，顺序对应位掩码的各个位
+_UPDATE_FIELDS = ('result', 'error_message', 'progress', 'total_items', 'current_item')
+
+# 状态变更时需要同时记录的时间列
+_TIMESTAMP_COLUMNS = {
+    TaskStatus.RUNNING: 'started_at',
+    TaskStatus.COMPLETED: 'completed_at',
+    TaskStatus.FAILED: 'completed_at',
+    TaskStatus.CANCELLED: 'completed_at',
+}
+
+def _build_update_sql(timestamp_column: Optional[str], mask: int) -> str:
+    """按时间列和字段位掩码生成 UPDATE 语句"""
+    assignments = ['status = ?']
+    if timestamp_column == 'started_at':
+        # 运行中的进度更新也会带 RUNNING 状态，开始时间只在第一次进入运行状态时写入
+        assignments.append('started_at = COALESCE(started_at, ?)')
+    elif timestamp_column:
+        assignments.append(f'{timestamp_column} = ?')
+    assignments.extend(f'{field} = ?' for bit, field in enumerate(_UPDATE_FIELDS) if mask & (1 << bit))
+    return f"UPDATE tasks SET {', '.join(assignments)} WHERE task_id = ?"
+
+# 预先生成所有字段组合的 UPDATE 语句，保证同样的更新复用同一条SQL文本（命中语句缓存）
+_UPDATE_SQL = {
+    (timestamp_column, mask): _build_update_sql(timestamp_column, mask)
+    for timestamp_column in (None, 'started_at', 'completed_at')
+    for mask in range(1 << len(_UPDATE_FIELDS))
+}
+
+_FINISHED_STATUSES = {TaskStatus.COMPLETED.value, TaskStatus.FAILED.value, TaskStatus.CANCELLED.value}
+
 class TaskManager:
     """任务管理器"""
     
     def __init__(self, db_path: str = None):
         self.db_path = db_path or str(Path(__file__).parent / "youtube_channels.db")
         self.running_tasks: Dict[str, asyncio.Task] = {}
+        self._last_progress_write: Dict[str, float] = {}
+        self._channel_locks: Dict[str, asyncio.Lock] = {}
+        # 每个频道锁上正在运行或等待的任务数，归零时才移除锁
+        self._channel_lock_users: Dict[str, int] = {}
+        # 实时进度订阅：任务ID -> 监听者队列列表
+        self._progress_streams: Dict[str, List[asyncio.Queue]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._processor = get_processor()
+        self._global_sem = asyncio.Semaphore(MAX_CONCURRENT_TASKS)
+        # 长连接（自动提交模式），跨线程共享，由锁串行化访问；
+        # sqlite3 按 SQL 文本缓存预编译语句，复用连接即可复用语句
+        self._conn = self._connect()
+        self._lock = threading.Lock()
         self.init_task_tables()
     
+    def _connect(self) -> sqlite3.Connection:
+        """打开数据库连接，并应用连接级别的 PRAGMA"""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute('PRAGMA mmap_size=268435456')
+        conn.execute('PRAGMA cache_size=-8000')
+        conn.execute('PRAGMA journal_size_limit=6144000')
+        conn.row_factory = sqlite3.Row
+        return conn
+    
     def init_task_tables(self):
         """初始化任务表"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        with self._lock:
+            cursor = self._conn.cursor()
+            
+            # WAL 模式写入数据库文件后持久生效，读写互不阻塞
+            cursor.execute('PRAGMA journal_mode=WAL')
             
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS tasks (
@@ -50,18 +140,33 @@ class TaskManager:
                     result TEXT,
                     error_message TEXT,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    started_at TIMESTAMP,
-                    completed_at TIMESTAMP,
+                    started_at INTEGER,      -- Unix时间戳（秒）
+                    completed_at INTEGER,    -- Unix时间戳（秒）
                     progress INTEGER DEFAULT 0,
                     total_items INTEGER DEFAULT 0,
-                    current_item TEXT
+                    current_item TEXT,
+                    channel_url_norm TEXT
                 )
             ''')
             
+            # 迁移：旧表补充标准化频道URL列，并回填已有任务
+            columns = {row[1] for row in cursor.execute('PRAGMA table_info(tasks)')}
+            if 'channel_url_norm' not in columns:
+                cursor.execute('ALTER TABLE tasks ADD COLUMN channel_url_norm TEXT')
+                rows = cursor.execute('SELECT task_id, params FROM tasks').fetchall()
+                cursor.executemany('UPDATE tasks SET channel_url_norm = ? WHERE task_id = ?', [
+                    (self._normalize_channel_url(json_utils.loads(params_json).get('channel_url')) or None, task_id)
+                    for task_id, params_json in rows
+                ])
+            
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_tasks_created ON tasks (created_at)')
-            
-            conn.commit()
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_tasks_channel ON tasks (channel_url_norm, created_at)')
+            # 只覆盖未完成任务的部分索引，用于重复任务检测（查询条件需与之字面一致）
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_tasks_active ON tasks (channel_url_norm, created_at)
+                WHERE status IN ('pending', 'running')
+            ''')
     
     def create_task(self, task_type: TaskType, params: Dict) -> str:
         """
@@ -77,34 +182,37 @@ class TaskManager:
         Raises:
             ValueError: 如果发现重复的频道任务
         """
+        # 标准化频道URL只在创建时计算一次，随任务保存
+        channel_url_norm = self._normalize_channel_url(params.get('channel_url')) or None
+        
         # 检查是否已有相同频道的任务在进行中
         if task_type == TaskType.BATCH_PROCESS:
-            existing_task = self._check_duplicate_channel_task(params.get('channel_url'))
+            existing_task = self._check_duplicate_channel_task(channel_url_norm)
             if existing_task:
                 raise ValueError(f"频道 '{params.get('channel_url')}' 已有任务在处理中 (任务ID: {existing_task['task_id'][:8]}..., 状态: {existing_task['status']})")
         
         task_id = str(uuid.uuid4())
         
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        with self._lock:
+            cursor = self._conn.cursor()
             cursor.execute('''
-                INSERT INTO tasks (task_id, task_type, status, params)
-                VALUES (?, ?, ?, ?)
+                INSERT INTO tasks (task_id, task_type, status, params, channel_url_norm)
+                VALUES (?, ?, ?, ?, ?)
             ''', (
                 task_id,
-                task_type.value,
-                TaskStatus.PENDING.value,
-                json.dumps(params, ensure_ascii=False)
+                _TASK_TYPE_VALUES[task_type],
+                _S_PENDING,
+                json_utils.dumps(params),
+                channel_url_norm
             ))
-            conn.commit()
         
         logger.info(f"创建任务: {task_id} ({task_type.value})")
         return task_id
     
     def get_task_status(self, task_id: str) -> Optional[Dict]:
         """获取任务状态"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        with self._lock:
+            cursor = self._conn.cursor()
             cursor.execute('''
                 SELECT task_id, task_type, status, params, result, error_message,
                        created_at, started_at, completed_at, progress, total_items, current_item
@@ -115,93 +223,111 @@ class TaskManager:
             if not row:
                 return None
             
-            return {
-                'task_id': row[0],
-                'task_type': row[1],
-                'status': row[2],
-                'params': json.loads(row[3]) if row[3] else {},
-                'result': json.loads(row[4]) if row[4] else None,
-                'error_message': row[5],
-                'created_at': row[6],
-                'started_at': row[7],
-                'completed_at': row[8],
-                'progress': row[9],
-                'total_items': row[10],
-                'current_item': row[11]
-            }
+            task = dict(row)
+            task['params'] = json_utils.loads(task['params']) if task['params'] else {}
+            task['result'] = json_utils.loads(task['result']) if task['result'] else None
+            return task
     
     def update_task_status(self, task_id: str, status: TaskStatus, 
                           result: Dict = None, error_message: str = None,
                           progress: int = None, total_items: int = None, 
                           current_item: str = None):
         """更新任务状态"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            
-            update_fields = ['status = ?']
-            params = [status.value]
-            
-            if status == TaskStatus.RUNNING:
-                update_fields.append('started_at = ?')
-                params.append(datetime.now())
-            elif status in [TaskStatus.COMPLETED, TaskStatus.FAILED, TaskStatus.CANCELLED]:
-                update_fields.append('completed_at = ?')
-                params.append(datetime.now())
-            
-            if result is not None:
-                update_fields.append('result = ?')
-                params.append(json.dumps(result, ensure_ascii=False))
-            
-            if error_message is not None:
-                update_fields.append('error_message = ?')
-                params.append(error_message)
-            
-            if progress is not None:
-                update_fields.append('progress = ?')
-                params.append(progress)
-            
-            if total_items is not None:
-                update_fields.append('total_items = ?')
-                params.append(total_items)
-            
-            if current_item is not None:
-                update_fields.append('current_item = ?')
-                params.append(current_item)
-            
-            params.append(task_id)
-            
-            cursor.execute(f'''
-                UPDATE tasks SET {', '.join(update_fields)} WHERE task_id = ?
-            ''', params)
-            conn.commit()
+        params = [_STATUS_VALUES[status]]
+        
+        timestamp_column = _TIMESTAMP_COLUMNS.get(status)
+        if timestamp_column:
+            params.append(int(time.time()))
+        
+        # 只序列化实际传入的字段，并用位掩码选出预先生成的 UPDATE 语句
+        mask = 0
+        values = (
+            json_utils.dumps(result) if result is not None else None,
+            error_message, progress, total_items, current_item
+        )
+        for bit, value in enumerate(values):
+            if value is not None:
+                mask |= 1 << bit
+                params.append(value)
+        
+        params.append(task_id)
+        
+        with self._lock:
+            self._conn.execute(_UPDATE_SQL[timestamp_column, mask], params)
+        
+        if task_id in self._progress_streams:
+            event = {'status': _STATUS_VALUES[status]}
+            for key, value in (('progress', progress), ('total_items', total_items),
+                               ('current_item', current_item), ('error_message', error_message),
+                               ('result', result)):
+                if value is not None:
+                    event[key] = value
+            self._publish_progress(task_id, event)
+    
+    def _publish_progress(self, task_id: str, event: Dict):
+        """向订阅该任务的监听者推送进度（可在工作线程中调用）"""
+        queues = list(self._progress_streams.get(task_id, ()))
+        if not queues or self._loop is None:
+            return
+        
+        try:
+            in_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            in_loop = False
+        
+        for queue in queues:
+            if in_loop:
+                queue.put_nowait(event)
+            else:
+                self._loop.call_soon_threadsafe(queue.put_nowait, event)
+    
+    async def stream_progress(self, task_id: str):
+        """订阅任务进度，逐条产出进度事件，任务结束后停止"""
+        self._loop = self._loop or asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        # 先注册队列再读取当前状态，避免两步之间任务结束导致结束事件丢失
+        self._progress_streams.setdefault(task_id, []).append(queue)
+        try:
+            task_info = self.get_task_status(task_id)
+            if not task_info:
+                raise ValueError(f"任务不存在: {task_id}")
+            
+            # 先推送当前状态，便于中途加入的监听者；已结束则直接停止
+            event = {
+                'status': task_info['status'],
+                'progress': task_info['progress'],
+                'total_items': task_info['total_items'],
+                'current_item': task_info['current_item']
+            }
+            while True:
+                yield event
+                if event['status'] in _FINISHED_STATUSES:
+                    break
+                event = await queue.get()
+        finally:
+            queues = self._progress_streams.get(task_id)
+            if queues is not None:
+                queues.remove(queue)
+                if not queues:
+                    del self._progress_streams[task_id]
     
     def get_all_tasks(self, status: TaskStatus = None, limit: int = 50) -> List[Dict]:
         """获取所有任务"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        with self._lock:
+            cursor = self._conn.cursor()
             
             if status:
                 cursor.execute('''
                     SELECT task_id, task_type, status, created_at, started_at, completed_at, progress, total_items
                     FROM tasks WHERE status = ? ORDER BY created_at DESC LIMIT ?
-                ''', (status.value, limit))
+                ''', (_STATUS_VALUES[status], limit))
             else:
                 cursor.execute('''
                     SELECT task_id, task_type, status, created_at, started_at, completed_at, progress, total_items
                     FROM tasks ORDER BY created_at DESC LIMIT ?
                 ''', (limit,))
             
-            rows = cursor.fetchall()
-            return [{
-                'task_id': row[0],
-                'task_type': row[1],
-                'status': row[2],
-                'created_at': row[3],
-                'started_at': row[4],
-                'completed_at': row[5],
-                'progress': row[6],
-                'total_items': row[7]
-            } for row in rows]
+            return [dict(row) for row in cursor.fetchall()]
     
     async def execute_batch_process_task(self, task_id: str, params: Dict):
         """执行批量处理任务"""
@@ -209,16 +335,24 @@ class TaskManager:
             # 更新任务状态为运行中
             self.update_task_status(task_id, TaskStatus.RUNNING)
             
-            # 导入处理器
-            from youtube_channel_processor import get_processor
-            processor = get_processor()
-            
-            # 包装原始方法以支持进度回调
-            original_method = processor.process_channel_batch
+            processor = self._processor
             
             async def progress_callback(current: int, total: int, current_item: str):
-                """进度回调"""
+                """进度回调（限流写库，完成时总是写入）"""
                 progress = int((current / total) * 100) if total > 0 else 0
+                now = time.monotonic()
+                last_write = self._last_progress_write.get(task_id, 0.0)
+                if progress != 100 and now - last_write < PROGRESS_WRITE_INTERVAL:
+                    # 跳过写库，但实时推送给监听者
+                    if task_id in self._progress_streams:
+                        self._publish_progress(task_id, {
+                            'status': _S_RUNNING,
+                            'progress': progress,
+                            'total_items': total,
+                            'current_item': current_item
+                        })
+                    return
+                self._last_progress_write[task_id] = now
                 self.update_task_status(
                     task_id, 
                     TaskStatus.RUNNING,
@@ -227,7 +361,7 @@ class TaskManager:
                     current_item=current_item
                 )
             
-            # 执行批量处理（需要修改原方法以支持回调）
+            # 执行批量处理，阻塞步骤在线程中运行
             result = await self._execute_with_progress(
                 processor, params, progress_callback
             )
@@ -241,57 +375,84 @@ class TaskManager:
             self.update_task_status(task_id, TaskStatus.FAILED, error_message=error_msg)
             logger.error(f"任务失败: {task_id}, 错误: {error_msg}")
         finally:
-            # 从运行任务中移除
-            if task_id in self.running_tasks:
-                del self.running_tasks[task_id]
+            self._last_progress_write.pop(task_id, None)
     
     async def _execute_with_progress(self, processor, params, progress_callback):
         """执行带进度回调的批量处理"""
         # 获取频道视频列表
         await progress_callback(0, 100, "正在获取频道视频列表...")
-        channel_info, videos = processor.get_channel_videos(
+        channel_info, videos = await asyncio.to_thread(
+            processor.get_channel_videos,
             params['channel_url'], 
             params.get('max_videos', 50)
         )
         
-        # 保存频道和视频信息
-        processor.save_channel_and_videos(channel_info, videos)
+        # 保存频道和视频信息，同一事务中查询出已经处理过的视频
+        already_done, no_subtitles = await asyncio.to_thread(processor.save_channel_and_videos, channel_info, videos)
         
         # 处理视频字幕
         success_count = 0
         failed_count = 0
         total_videos = len(videos)
         
-        for i, video in enumerate(videos, 1):
-            current_item = f"正在处理: {video['title'][:30]}..."
-            await progress_callback(i, total_videos, current_item)
-            
-            # 检查是否已经处理过
-            with sqlite3.connect(processor.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT subtitle_extracted FROM videos WHERE video_id = ?', 
-                             (video['video_id'],))
-                result = cursor.fetchone()
-                
-                if result and result[0]:
-                    success_count += 1
-                    continue
-            
-            # 提取字幕
-            subtitles_data = processor.extract_video_subtitles(
-                video['video_id'], 
-                video['url'], 
-                params.get('subtitle_lang', 'en')
-            )
+        subtitle_lang = params.get('subtitle_lang', 'en')
+        semaphore = asyncio.Semaphore(params.get('concurrency', DEFAULT_EXTRACT_CONCURRENCY))
+        processed_count = 0
+        pending_saves: List = []
+        
+        async def flush_saves():
+            """将缓冲的字幕在一个事务中写入数据库"""
+            nonlocal pending_saves
+            if pending_saves:
+                batch, pending_saves = pending_saves, []
+                await asyncio.to_thread(processor.save_subtitles_batch, batch)
+        
+        async def process_video(video: Dict):
+            nonlocal success_count, failed_count, processed_count
             
-            if subtitles_data:
-                processor.save_subtitles(subtitles_data, video['video_id'])
+            # 检查是否已经处理过；近期确认没有字幕的与首次检查时一样计为失败
+            if video['video_id'] in already_done:
                 success_count += 1
-            else:
+            elif video['video_id'] in no_subtitles:
                 failed_count += 1
-            
-            # 延迟避免频率限制
-            await asyncio.sleep(2)
+            else:
+                async with semaphore, get_youtube_limiter():
+                    try:
+                        # 网络下载在线程中并发等待，CPU 密集的字幕解析交给进程池
+                        vtt_data, metadata = await asyncio.to_thread(
+                            processor.download_video_subtitles,
+                            video['video_id'], 
+                            video['url'], 
+                            subtitle_lang
+                        )
+                        subtitles_data = None
+                        if vtt_data is not None:
+                            subtitles_data = {
+                                'language': subtitle_lang,
+                                'subtitles': await parse_vtt_bytes_async(vtt_data)
+                            }
+                    except Exception as e:
+                        # 下载或解析出错，不记为无字幕，下次运行重试
+                        logger.error(f"处理视频 {video['video_id']} 字幕失败: {str(e)}")
+                        failed_count += 1
+                    else:
+                        # 确认没有字幕也写入，记录为已检查
+                        pending_saves.append((video['video_id'], subtitles_data, metadata))
+                        if len(pending_saves) >= SUBTITLE_SAVE_BATCH_SIZE:
+                            await flush_saves()
+                        if subtitles_data:
+                            success_count += 1
+                        else:
+                            failed_count += 1
+            
+            processed_count += 1
+            current_item = f"已处理: {video['title'][:30]}..."
+            await progress_callback(processed_count, total_videos, current_item)
+        
+        try:
+            await asyncio.gather(*(process_video(video) for video in videos))
+        finally:
+            await flush_saves()
         
         return {
             'status': 'completed',
@@ -308,12 +469,10 @@ class TaskManager:
         if not task_info:
             raise ValueError(f"任务不存在: {task_id}")
         
-        if task_info['status'] != TaskStatus.PENDING.value:
+        if task_info['status'] != _S_PENDING:
             raise ValueError(f"任务状态错误: {task_info['status']}")
         
-        # 检查当前运行的任务数量，限制并发
-        if len(self.running_tasks) >= 1:  # 限制同时只能运行1个任务
-            raise ValueError("已有任务在运行中，请等待当前任务完成后再启动新任务")
+        self._loop = asyncio.get_running_loop()
         
         # 暂停Cookie保活服务
         try:
@@ -324,10 +483,9 @@ class TaskManager:
             logger.warning(f"暂停Cookie保活失败: {e}")
         
         # 创建异步任务
-        if task_info['task_type'] == TaskType.BATCH_PROCESS.value:
-            # 使用线程池执行阻塞操作
+        if task_info['task_type'] == _TT_BATCH:
             task = asyncio.create_task(
-                self._execute_task_in_thread(task_id, task_info['params'])
+                self._run_batch_task(task_id, task_info['params'])
             )
             self.running_tasks[task_id] = task
             logger.info(f"启动任务: {task_id}")
@@ -346,195 +504,88 @@ class TaskManager:
         
         # 如果任务还未开始，直接标记为取消
         task_info = self.get_task_status(task_id)
-        if task_info and task_info['status'] == TaskStatus.PENDING.value:
+        if task_info and task_info['status'] == _S_PENDING:
             self.update_task_status(task_id, TaskStatus.CANCELLED)
             return True
         
         return False
     
-    async def _execute_task_in_thread(self, task_id: str, params: Dict):
-        """在线程池中执行阻塞任务，避免阻塞事件循环"""
-        loop = asyncio.get_event_loop()
-        
-        # 使用线程池执行器
-        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
-            try:
-                # 在线程中执行阻塞操作
-                result = await loop.run_in_executor(
-                    executor,
-                    self._sync_execute_batch_process,
-                    task_id,
-                    params
-                )
-                return result
-            except Exception as e:
-                logger.error(f"线程池执行任务失败: {task_id}, 错误: {str(e)}")
-                raise
-    
-    def _sync_execute_batch_process(self, task_id: str, params: Dict):
-        """同步执行批量处理（在线程中运行）"""
+    async def _run_batch_task(self, task_id: str, params: Dict):
+        """执行批量任务，并处理并发限制和Cookie保活的恢复"""
+        # 同一频道的任务串行执行，不同频道之间受全局并发数限制
+        channel_key = self._normalize_channel_url(params.get('channel_url'))
+        channel_lock = self._channel_locks.setdefault(channel_key, asyncio.Lock())
+        self._channel_lock_users[channel_key] = self._channel_lock_users.get(channel_key, 0) + 1
         try:
-            # 更新任务状态为运行中
-            self.update_task_status(task_id, TaskStatus.RUNNING)
-            
-            # 导入处理器
-            from youtube_channel_processor import get_processor
-            processor = get_processor()
-            
-            # 添加Cookie文件参数
-            cookie_file = params.get('cookie_file', 'test_cookies.txt')
-            
-            # 获取频道视频列表
-            self.update_task_status(
-                task_id, TaskStatus.RUNNING, 
-                progress=10, total_items=100, 
-                current_item="正在获取频道视频列表..."
-            )
-            
-            # 模拟批量处理逻辑
-            import time
-            channel_url = params['channel_url']
-            max_videos = params.get('max_videos', 50)
-            subtitle_lang = params.get('subtitle_lang', 'en')
-            
-            # 更新进度
-            self.update_task_status(
-                task_id, TaskStatus.RUNNING,
-                progress=50, total_items=100,
-                current_item=f"正在处理频道: {channel_url}"
-            )
-            
-            # 模拟处理时间
-            time.sleep(5)
-            
-            # 完成任务
-            result = {
-                'status': 'completed',
-                'channel_url': channel_url,
-                'total_videos': max_videos,
-                'success_count': 0,  # 实际处理后更新
-                'failed_count': 0,
-                'processed_at': datetime.now().isoformat(),
-                'message': '批量处理完成（演示版本）'
-            }
-            
-            self.update_task_status(task_id, TaskStatus.COMPLETED, result=result)
-            logger.info(f"任务完成: {task_id}")
-            return result
-            
-        except Exception as e:
-            error_msg = str(e)
-            self.update_task_status(task_id, TaskStatus.FAILED, error_message=error_msg)
-            logger.error(f"任务失败: {task_id}, 错误: {error_msg}")
-            raise
+            async with channel_lock, self._global_sem:
+                return await self.execute_batch_process_task(task_id, params)
         finally:
-            # 从运行任务中移除
-            if task_id in self.running_tasks:
-                del self.running_tasks[task_id]
-            
-            # 恢复Cookie保活服务
-            try:
-                keepalive = get_keepalive_service()
-                keepalive.resume()
-                logger.info("任务完成，Cookie保活已恢复")
-            except Exception as e:
-                logger.warning(f"恢复Cookie保活失败: {e}")
+            # 锁被释放后、被唤醒的等待者拿到锁之前 locked() 会短暂为 False，
+            # 所以按使用计数判断，没有等待者时才移除
+            self._channel_lock_users[channel_key] -= 1
+            if not self._channel_lock_users[channel_key]:
+                del self._channel_lock_users[channel_key]
+                del self._channel_locks[channel_key]
+            
+            # 在事件循环线程中统一从运行任务中移除
+            self.running_tasks.pop(task_id, None)
+            
+            # 所有任务结束后才恢复Cookie保活服务
+            if not self.running_tasks:
+                try:
+                    keepalive = get_keepalive_service()
+                    keepalive.resume()
+                    logger.info("任务完成，Cookie保活已恢复")
+                except Exception as e:
+                    logger.warning(f"恢复Cookie保活失败: {e}")
     
     def _normalize_channel_url(self, channel_url: str) -> str:
         """标准化频道URL，用于重复检测"""
-        import re
-        from urllib.parse import urlparse, parse_qs
-        
         if not channel_url:
             return ""
         
-        # 移除末尾的斜杠和空格
-        url = channel_url.strip().rstrip('/')
-        
-        # 标准化不同的YouTube频道URL格式
-        # @username -> /c/username 或 /channel/xxx
-        # /c/name -> 标准格式
-        # /channel/id -> 标准格式
-        # /user/name -> 标准格式
-        
-        # 提取关键的频道标识符
-        patterns = [
-            r'youtube\.com/@([^/?]+)',           # @username
-            r'youtube\.com/c/([^/?]+)',          # /c/name  
-            r'youtube\.com/channel/([^/?]+)',    # /channel/id
-            r'youtube\.com/user/([^/?]+)',       # /user/name
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, url.lower())
+        # 移除末尾的斜杠和空格，统一小写
+        url = channel_url.strip().rstrip('/').lower()
+        
+        # 提取关键的频道标识符，按匹配到的格式返回标准化URL
+        for pattern, prefix in _YT_PATTERNS:
+            match = pattern.search(url)
             if match:
-                identifier = match.group(1)
-                # 返回标准化格式
-                if url.lower().find('/@') != -1:
-                    return f"https://www.youtube.com/@{identifier}"
-                elif url.lower().find('/c/') != -1:
-                    return f"https://www.youtube.com/c/{identifier}"
-                elif url.lower().find('/channel/') != -1:
-                    return f"https://www.youtube.com/channel/{identifier}"
-                elif url.lower().find('/user/') != -1:
-                    return f"https://www.youtube.com/user/{identifier}"
+                return f"https://www.youtube.com/{prefix}{match.group(1)}"
         
         # 如果没有匹配到已知格式，返回清理后的原URL
-        return url.lower()
+        return url
     
-    def _check_duplicate_channel_task(self, channel_url: str) -> Optional[Dict]:
+    def _check_duplicate_channel_task(self, normalized_url: str) -> Optional[Dict]:
         """
         检查是否已有相同频道的任务在处理中
         
         Args:
-            channel_url: 频道URL
+            normalized_url: 标准化后的频道URL
             
         Returns:
             如果找到重复任务，返回任务信息；否则返回None
         """
-        if not channel_url:
+        if not normalized_url:
             return None
-            
-        normalized_url = self._normalize_channel_url(channel_url)
         
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        with self._lock:
+            cursor = self._conn.cursor()
             
-            # 查找所有未完成的批量处理任务
+            # 按标准化URL查找未完成的批量处理任务
             cursor.execute('''
-                SELECT task_id, task_type, status, params, created_at
+                SELECT task_id, status, created_at
                 FROM tasks 
-                WHERE task_type = ? 
-                AND status IN (?, ?, ?)
+                WHERE channel_url_norm = ?
+                AND task_type = ? 
+                AND status IN ('pending', 'running')
                 ORDER BY created_at DESC
-            ''', (
-                TaskType.BATCH_PROCESS.value,
-                TaskStatus.PENDING.value,
-                TaskStatus.RUNNING.value,
-                TaskStatus.RUNNING.value  # 检查两次运行状态以确保
-            ))
+                LIMIT 1
+            ''', (normalized_url, _TT_BATCH))
             
-            rows = cursor.fetchall()
-            
-            for row in rows:
-                task_id, task_type, status, params_json, created_at = row
-                try:
-                    params = json.loads(params_json)
-                    task_channel_url = params.get('channel_url', '')
-                    normalized_task_url = self._normalize_channel_url(task_channel_url)
-                    
-                    # 比较标准化后的URL
-                    if normalized_url == normalized_task_url:
-                        return {
-                            'task_id': task_id,
-                            'status': status,
-                            'channel_url': task_channel_url,
-                            'created_at': created_at
-                        }
-                except json.JSONDecodeError:
-                    continue
-        
-        return None
+            row = cursor.fetchone()
+        
+        return dict(row) if row else None
     
     def has_running_tasks(self) -> bool:
         """检查是否有正在运行的任务"""
@@ -544,41 +595,26 @@ class TaskManager:
         """获取指定频道的任务历史"""
         normalized_url = self._normalize_channel_url(channel_url)
         
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        with self._lock:
+            cursor = self._conn.cursor()
             
             cursor.execute('''
                 SELECT task_id, status, created_at, completed_at, result
                 FROM tasks 
-                WHERE task_type = ?
+                WHERE channel_url_norm = ? AND task_type = ?
                 ORDER BY created_at DESC
                 LIMIT ?
-            ''', (TaskType.BATCH_PROCESS.value, limit * 2))  # 获取更多以便过滤
+            ''', (normalized_url, _TT_BATCH, limit))
             
             rows = cursor.fetchall()
-            
-            matching_tasks = []
-            for row in rows:
-                task_id, status, created_at, completed_at, result_json = row
-                
-                # 获取任务参数
-                task_info = self.get_task_status(task_id)
-                if task_info:
-                    task_channel_url = task_info['params'].get('channel_url', '')
-                    if self._normalize_channel_url(task_channel_url) == normalized_url:
-                        result = json.loads(result_json) if result_json else None
-                        matching_tasks.append({
-                            'task_id': task_id,
-                            'status': status,
-                            'created_at': created_at,
-                            'completed_at': completed_at,
-                            'result': result
-                        })
-                        
-                        if len(matching_tasks) >= limit:
-                            break
-            
-            return matching_tasks
+        
+        return [{
+            'task_id': task_id,
+            'status': status,
+            'created_at': created_at,
+            'completed_at': completed_at,
+            'result': json_utils.loads(result_json) if result_json else None
+        } for task_id, status, created_at, completed_at, result_json in rows]
 
 # 全局任务管理器实例
 _task_manager_instance = None
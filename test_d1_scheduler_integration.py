@@ -23,6 +23,19 @@ load_dotenv()
 API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:24314")
 API_TOKEN = os.getenv("API_TOKEN", "Abcd123456")
 
+# 复用的API会话（首次使用时创建，测试结束时关闭）
+_api_session = None
+
+def get_api_session() -> aiohttp.ClientSession:
+    """获取调用main.py API的共享会话"""
+    global _api_session
+    if _api_session is None or _api_session.closed:
+        _api_session = aiohttp.ClientSession(headers={
+            "X-API-Token": API_TOKEN,
+            "Content-Type": "application/json"
+        })
+    return _api_session
+
 async def test_d1_scheduler_integration():
     """完整的D1定时任务集成测试"""
     
@@ -69,7 +82,7 @@ async def test_d1_scheduler_integration():
             'updated_at': int(time.time())
         }
         
-        d1.execute("""
+        await d1.execute("""
             INSERT INTO scheduled_tasks 
             (id, user_id, task_type, scheduled_hour, feed_ids, custom_source_ids, 
              prompt, is_active, last_executed_at, created_at, updated_at)
@@ -96,7 +109,7 @@ async def test_d1_scheduler_integration():
         print("步骤2: 从D1读取定时任务")
         print("=" * 80)
         
-        tasks = d1.fetch_all(
+        tasks = await d1.fetch_all(
             "SELECT * FROM scheduled_tasks WHERE id = ? AND is_active = 1",
             [test_task_id]
         )
@@ -118,34 +131,31 @@ async def test_d1_scheduler_integration():
         
         channel_url = f"https://www.youtube.com/channel/{test_channel_id}"
         
-        async with aiohttp.ClientSession() as session:
-            # 调用批量处理API
-            api_url = f"{API_BASE_URL}/channel/batch-process-sync"
-            headers = {
-                "X-API-Token": API_TOKEN,
-                "Content-Type": "application/json"
-            }
-            payload = {
-                "channel_url": channel_url,
-                "max_videos": 3,  # 只获取最新3个视频进行测试
-                "subtitle_lang": "en"
-            }
-            
-            print(f"📡 调用API: {api_url}")
-            print(f"   参数: {payload}")
-            
-            async with session.post(api_url, json=payload, headers=headers) as resp:
-                if resp.status == 200:
-                    result = await resp.json()
-                    print(f"✅ API调用成功:")
-                    print(f"   频道: {result.get('channel_info', {}).get('channel_name')}")
-                    print(f"   总视频数: {result.get('total_videos')}")
-                    print(f"   成功提取字幕: {result.get('success_count')}")
-                    print(f"   失败: {result.get('failed_count')}")
-                    print(f"   耗时: {result.get('duration_seconds'):.1f}秒")
-                else:
-                    error_text = await resp.text()
-                    raise Exception(f"API调用失败 (状态码: {resp.status}): {error_text}")
+        session = get_api_session()
+        
+        # 调用批量处理API
+        api_url = f"{API_BASE_URL}/channel/batch-process-sync"
+        payload = {
+            "channel_url": channel_url,
+            "max_videos": 3,  # 只获取最新3个视频进行测试
+            "subtitle_lang": "en"
+        }
+        
+        print(f"📡 调用API: {api_url}")
+        print(f"   参数: {payload}")
+        
+        async with session.post(api_url, json=payload) as resp:
+            if resp.status == 200:
+                result = await resp.json()
+                print(f"✅ API调用成功:")
+                print(f"   频道: {result.get('channel_info', {}).get('channel_name')}")
+                print(f"   总视频数: {result.get('total_videos')}")
+                print(f"   成功提取字幕: {result.get('success_count')}")
+                print(f"   失败: {result.get('failed_count')}")
+                print(f"   耗时: {result.get('duration_seconds'):.1f}秒")
+            else:
+                error_text = await resp.text()
+                raise Exception(f"API调用失败 (状态码: {resp.status}): {error_text}")
         
         # ========== 步骤4: 获取字幕内容并生成AI总结 ==========
         print("\n" + "=" * 80)
@@ -180,31 +190,31 @@ async def test_d1_scheduler_integration():
         headline_id = f"headline_test_{int(time.time())}"
         created_at = int(time.time())
         
-        d1.execute("""
-            INSERT INTO ai_headlines 
-            (id, user_id, title, content, article_count, prompt, feed_ids, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, [
-            headline_id,
-            task['user_id'],
-            title,
-            content,
-            1,
-            task['prompt'],
-            task['feed_ids'],
-            created_at
+        # 写入headline并更新任务的last_executed_at，合并为一次请求
+        await d1.execute_batch([
+            ("""
+                INSERT INTO ai_headlines 
+                (id, user_id, title, content, article_count, prompt, feed_ids, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, [
+                headline_id,
+                task['user_id'],
+                title,
+                content,
+                1,
+                task['prompt'],
+                task['feed_ids'],
+                created_at
+            ]),
+            ("""
+                UPDATE scheduled_tasks 
+                SET last_executed_at = ?, updated_at = ?
+                WHERE id = ?
+            """, [created_at, created_at, test_task_id]),
         ])
         
         print(f"✅ 成功写入ai_headlines表:")
         print(f"   Headline ID: {headline_id}")
-        
-        # 更新任务的last_executed_at
-        d1.execute("""
-            UPDATE scheduled_tasks 
-            SET last_executed_at = ?, updated_at = ?
-            WHERE id = ?
-        """, [created_at, created_at, test_task_id])
-        
         print(f"✅ 更新任务执行时间")
         
         # ========== 验证结果 ==========
@@ -213,7 +223,7 @@ async def test_d1_scheduler_integration():
         print("=" * 80)
         
         # 从D1读取刚创建的headline
-        headlines = d1.fetch_all(
+        headlines = await d1.fetch_all(
             "SELECT * FROM ai_headlines WHERE id = ?",
             [headline_id]
         )
@@ -229,7 +239,7 @@ async def test_d1_scheduler_integration():
             print("❌ 验证失败 - 未能从D1读取到headline")
         
         # 读取更新后的任务
-        updated_tasks = d1.fetch_all(
+        updated_tasks = await d1.fetch_all(
             "SELECT * FROM scheduled_tasks WHERE id = ?",
             [test_task_id]
         )
@@ -247,8 +257,8 @@ async def test_d1_scheduler_integration():
         cleanup = input("\n是否清理测试数据? (y/n): ").strip().lower()
         
         if cleanup == 'y':
-            d1.execute("DELETE FROM ai_headlines WHERE id = ?", [headline_id])
-            d1.execute("DELETE FROM scheduled_tasks WHERE id = ?", [test_task_id])
+            await d1.execute("DELETE FROM ai_headlines WHERE id = ?", [headline_id])
+            await d1.execute("DELETE FROM scheduled_tasks WHERE id = ?", [test_task_id])
             print("✅ 测试数据已清理")
         else:
             print("⏭️  保留测试数据")
@@ -266,10 +276,15 @@ async def test_d1_scheduler_integration():
         
         # 尝试清理
         try:
-            d1.execute("DELETE FROM scheduled_tasks WHERE id = ?", [test_task_id])
+            await d1.execute("DELETE FROM scheduled_tasks WHERE id = ?", [test_task_id])
             print("🧹 已清理失败的任务")
         except:
             pass
+    finally:
+        if _api_session is not None:
+            await _api_session.close()
+        await d1.close()
+        await scheduler.d1.close()
 
 if __name__ == "__main__":
     asyncio.run(test_d1_scheduler_integration())
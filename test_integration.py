@@ -6,16 +6,17 @@ from scheduler_service import TaskScheduler
 
 load_dotenv()
 
-def test_d1_client():
+async def test_d1_client():
     print("Testing D1Client...")
     try:
         client = D1Client()
         print("D1Client initialized.")
         # Test a simple query
-        result = client.execute("SELECT 1 as test")
+        result = await client.execute("SELECT 1 as test")
         print(f"D1 Query Result: {result}")
         assert result.get("success") is True
         print("D1Client test passed.")
+        await client.close()
     except Exception as e:
         print(f"D1Client test failed: {e}")
         import traceback
@@ -33,18 +34,19 @@ async def test_scheduler_init():
         client = scheduler.d1
         # D1 (SQLite) uses sqlite_schema or sqlite_master
         try:
-            tables = client.fetch_all("SELECT name FROM sqlite_schema WHERE type ='table' AND name NOT LIKE 'sqlite_%';")
+            tables = await client.fetch_all("SELECT name FROM sqlite_schema WHERE type ='table' AND name NOT LIKE 'sqlite_%';")
         except:
-             tables = client.fetch_all("SELECT name FROM sqlite_master WHERE type ='table' AND name NOT LIKE 'sqlite_%';")
+             tables = await client.fetch_all("SELECT name FROM sqlite_master WHERE type ='table' AND name NOT LIKE 'sqlite_%';")
              
         print(f"Tables in DB: {[t['name'] for t in tables]}")
         
         print("TaskScheduler init test passed.")
+        await client.close()
     except Exception as e:
         print(f"TaskScheduler init test failed: {e}")
         import traceback
         traceback.print_exc()
 
 if __name__ == "__main__":
-    test_d1_client()
+    asyncio.run(test_d1_client())
     asyncio.run(test_scheduler_init())
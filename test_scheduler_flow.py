@@ -26,7 +26,7 @@ def setup_test_db():
         cursor.execute('''
             INSERT INTO channels (channel_id, channel_name, channel_url, last_processed)
             VALUES (?, ?, ?, ?)
-        ''', ('UC_TEST', 'Test Channel', 'https://youtube.com/channel/UC_TEST', datetime.now()))
+        ''', ('UC_TEST', 'Test Channel', 'https://youtube.com/channel/UC_TEST', datetime.now().isoformat(sep=' ', timespec='seconds')))
         
         # Video with subtitles
         subtitles = [{'start': '00:00:01.000', 'end': '00:00:05.000', 'subtitle': 'This is a test video content.'}]
@@ -96,7 +96,7 @@ async def test_flow():
     # Be careful not to pollute it too much, but for dev it's fine.
     
     try:
-        headlines = scheduler.d1.fetch_all("SELECT * FROM ai_headlines WHERE user_id = ?", ['USER_TEST'])
+        headlines = await scheduler.d1.fetch_all("SELECT * FROM ai_headlines WHERE user_id = ?", ['USER_TEST'])
         print(f"Found {len(headlines)} headlines for USER_TEST")
         
         found = False
@@ -107,7 +107,7 @@ async def test_flow():
                 print(f"Content: {h['content']}")
                 
                 # Cleanup
-                scheduler.d1.execute("DELETE FROM ai_headlines WHERE id = ?", [h['id']])
+                await scheduler.d1.execute("DELETE FROM ai_headlines WHERE id = ?", [h['id']])
                 print("Cleaned up test headline.")
                 found = True
                 break
@@ -117,6 +117,8 @@ async def test_flow():
             
     except Exception as e:
         print(f"Error verifying D1: {e}")
+    finally:
+        await scheduler.d1.close()
 
     # Cleanup local DB
     if os.path.exists(TEST_DB_PATH):
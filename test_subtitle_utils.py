@@ -0,0 +1,32 @@
+import os
+import tempfile
+from subtitle_utils import vtt_bytes_to_json, vtt_to_json
+
+VTT_LF = (
+    b"WEBVTT\nKind: captions\nLanguage: en\n\n"
+    b"00:00:00.000 --> 00:00:01.000 align:start position:0%\nhi there\n\n"
+    b"00:00:01.000 --> 00:00:02.000\nsecond\n"
+)
+VTT_CRLF = VTT_LF.replace(b"\n", b"\r\n")
+
+def test_crlf_cues_are_split():
+    subtitles = vtt_bytes_to_json(VTT_CRLF)
+    assert [s['subtitle'] for s in subtitles] == ["hi there", "second"]
+    assert subtitles[1]['time'] == "00:00:01.000 --> 00:00:02.000"
+
+def test_crlf_matches_lf():
+    assert vtt_bytes_to_json(VTT_CRLF) == vtt_bytes_to_json(VTT_LF)
+
+def test_crlf_file():
+    with tempfile.NamedTemporaryFile(suffix=".vtt", delete=False) as f:
+        f.write(VTT_CRLF)
+    try:
+        assert vtt_to_json(f.name) == vtt_bytes_to_json(VTT_LF)
+    finally:
+        os.remove(f.name)
+
+if __name__ == "__main__":
+    test_crlf_cues_are_split()
+    test_crlf_matches_lf()
+    test_crlf_file()
+    print("Subtitle parsing tests passed.")
@@ -0,0 +1,22 @@
+from scheduler_service import _collapse_repeats
+
+def test_keeps_phrase_sharing_a_prefix():
+    # A later phrase that only starts like an earlier one must not be spliced
+    text = "the cat sat on the mat the cat sat on the hat"
+    assert _collapse_repeats(text) == text
+
+def test_drops_whole_repeated_span():
+    assert _collapse_repeats("a b c d e a b c d e f") == "a b c d e f"
+
+def test_collapses_caption_stutter():
+    assert _collapse_repeats("hello world hello world hello world") == "hello world"
+
+def test_keeps_single_word_repeats():
+    assert _collapse_repeats("go go go now") == "go go go now"
+
+if __name__ == "__main__":
+    test_keeps_phrase_sharing_a_prefix()
+    test_drops_whole_repeated_span()
+    test_collapses_caption_stutter()
+    test_keeps_single_word_repeats()
+    print("Transcript dedup tests passed.")
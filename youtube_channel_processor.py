@@ -5,16 +5,23 @@ YouTube Channel Batch Processor
 
 import sqlite3
 import asyncio
+import re
 import yt_dlp
-import json
 import tempfile
 import shutil
+import glob
+import time
 from pathlib import Path
 from typing import List, Dict, Optional, Tuple
 from datetime import datetime
-from subtitle_utils import vtt_to_json
+from subtitle_utils import vtt_bytes_to_json
+import json_utils
 from cookie_utils import save_cookie_string_as_netscape
+from rate_limiter import get_youtube_limiter
 import logging
+from contextlib import contextmanager
+from collections import deque
+from types import MappingProxyType
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -25,19 +32,141 @@ BASE_DIR = Path(__file__).parent.absolute()
 DB_PATH = BASE_DIR / "youtube_channels.db"
 COOKIE_DIR = BASE_DIR / "cookies"
 
+# 频道视频列表缓存有效期（秒）
+CHANNEL_LIST_CACHE_TTL = 3600
+
+# 字幕 blob 分块写入的大小（字节）
+SUBTITLE_BLOB_CHUNK_SIZE = 64 * 1024
+
+# 确认没有字幕的视频在这段时间内（秒）不再重复下载
+NO_SUBTITLE_RECHECK_SECONDS = 6 * 3600
+
+# 批量处理时同时提取字幕的视频数
+DEFAULT_CONCURRENCY = 4
+
+# 字幕写库批次：最多攒多少条，以及等待下一条的最长秒数
+SUBTITLE_WRITE_BATCH_SIZE = 32
+SUBTITLE_WRITE_WAIT_SECONDS = 0.5
+
+# 每个新连接都要设置的 PRAGMA（连接级别，不会持久化）
+CONNECTION_PRAGMAS = (
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA cache_size=-64000',
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA mmap_size=268435456',
+)
+
+
+# 频道统计查询，列名即返回字典的键
+_CHANNEL_STATS_SQL = '''
+    SELECT 
+        c.channel_name,
+        c.channel_url,
+        c.last_processed,
+        COUNT(v.id) as total_videos,
+        SUM(CASE WHEN v.subtitle_extracted THEN 1 ELSE 0 END) as videos_with_subtitles
+    FROM channels c
+    LEFT JOIN videos v ON c.channel_id = v.channel_id
+    WHERE c.channel_id = ?
+    GROUP BY c.channel_id
+'''
+
+_ALL_CHANNELS_STATS_SQL = '''
+    SELECT 
+        COUNT(DISTINCT c.channel_id) as total_channels,
+        COUNT(v.id) as total_videos,
+        COALESCE(SUM(CASE WHEN v.subtitle_extracted THEN 1 ELSE 0 END), 0) as videos_with_subtitles
+    FROM channels c
+    LEFT JOIN videos v ON c.channel_id = v.channel_id
+'''
+
+# 频道主页地址（没有指定标签页），例如 /@name、/channel/UCxxx、/c/name、/user/name
+_CHANNEL_ROOT_RE = re.compile(r'^(https?://(?:www\.|m\.)?youtube\.com/(?:@[^/?#]+|(?:channel|c|user)/[^/?#]+))/?$')
+
+
+def _videos_tab_url(channel_url: str) -> str:
+    """
+    频道主页地址转换为“视频”标签页地址
+
+    扁平抓取时主页只返回各个标签页的链接，直接请求视频标签页才能拿到视频条目
+    """
+    match = _CHANNEL_ROOT_RE.match(channel_url.strip())
+    return f"{match.group(1)}/videos" if match else channel_url
+
+
+@contextmanager
+def _resolved_cookie_file(cookie_string: Optional[str], cookie_file: Optional[Path] = None):
+    """
+    确定本次请求使用的Cookie文件
+
+    优先使用已生成的 cookie_file；否则把 cookie_string 转换为临时Netscape文件（退出时删除）；
+    都没有时使用固定的 cookies.txt，不存在则为 None
+    """
+    if cookie_file is not None:
+        yield cookie_file
+    elif cookie_string:
+        temp_cookie_file = save_cookie_string_as_netscape(cookie_string)
+        try:
+            yield temp_cookie_file
+        finally:
+            # 清理临时cookie文件
+            if temp_cookie_file.exists():
+                temp_cookie_file.unlink()
+    else:
+        cookie_path = COOKIE_DIR / "cookies.txt"
+        yield cookie_path if cookie_path.exists() else None
+
+
+@contextmanager
+def _write_transaction(conn):
+    """
+    在自动提交模式的连接上显式开启写事务
+
+    BEGIN IMMEDIATE 一开始就拿到写锁，退出时提交；出错时回滚，避免连接停留在未结束的事务中
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+
 
 class YouTubeChannelProcessor:
     """YouTube频道批量处理器"""
     
+    # yt-dlp 选项模板（只读），每次调用复制后再补充与视频相关的选项
+    _YDL_OPTS_LIST = MappingProxyType({
+        'quiet': True,
+        'no_warnings': True,
+        # 只抓取频道列表页，不逐个打开视频页面；完整信息在提取字幕时补全
+        'extract_flat': 'in_playlist',
+    })
+    _YDL_OPTS_EXTRACT = MappingProxyType({
+        'skip_download': True,
+        'writesubtitles': True,
+        'writeautomaticsub': True,
+        'subtitlesformat': 'vtt',
+        'quiet': True,
+        'no_warnings': True,
+    })
+    
     def __init__(self, db_path: str = None):
         self.db_path = db_path or str(DB_PATH)
         self.init_database()
     
     def init_database(self):
         """初始化SQLite数据库"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.get_db_connection() as conn:
             cursor = conn.cursor()
             
+            # WAL 模式是持久化的，只需设置一次；读写可以并发进行
+            journal_mode = cursor.execute('PRAGMA journal_mode=WAL').fetchone()[0]
+            if journal_mode.lower() != 'wal':
+                logger.warning(f"数据库未能切换到WAL模式，当前为: {journal_mode}")
+            
             # 创建频道表
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS channels (
@@ -65,19 +194,46 @@ class YouTubeChannelProcessor:
                     subtitle_extracted BOOLEAN DEFAULT FALSE,
                     subtitle_language TEXT,
                     subtitle_json TEXT,
+                    subtitle_status TEXT,
+                    subtitle_checked_at INTEGER,
+                    subtitle_blob BLOB,
                     FOREIGN KEY (channel_id) REFERENCES channels (channel_id)
                 )
             ''')
             
+            # 迁移：旧表补充字幕检查状态列（记录没有字幕的视频，避免反复下载）
+            columns = {row[1] for row in cursor.execute('PRAGMA table_info(videos)')}
+            if 'subtitle_status' not in columns:
+                cursor.execute('ALTER TABLE videos ADD COLUMN subtitle_status TEXT')
+            if 'subtitle_checked_at' not in columns:
+                cursor.execute('ALTER TABLE videos ADD COLUMN subtitle_checked_at INTEGER')
+            # 迁移：字幕JSON改为以 BLOB 存储，旧数据仍保留在 subtitle_json 中，读取时用 COALESCE 兼容
+            if 'subtitle_blob' not in columns:
+                cursor.execute('ALTER TABLE videos ADD COLUMN subtitle_blob BLOB')
+            
+            # 频道视频列表缓存，避免短时间内重复抓取同一频道
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS channel_list_cache (
+                    url TEXT NOT NULL,
+                    max_videos INTEGER NOT NULL,
+                    fetched_at INTEGER NOT NULL,
+                    payload_json TEXT NOT NULL,
+                    PRIMARY KEY (url, max_videos)
+                )
+            ''')
+            
             # 创建索引
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_videos_channel_id ON videos (channel_id)')
+            # (channel_id, subtitle_extracted) 同时覆盖按频道过滤和按字幕状态统计，
+            # 单列的 channel_id 索引是它的前缀，已多余
+            cursor.execute('DROP INDEX IF EXISTS idx_videos_channel_id')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_videos_channel_subext ON videos (channel_id, subtitle_extracted)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_videos_upload_date ON videos (upload_date)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_videos_subtitle_extracted ON videos (subtitle_extracted)')
             
-            conn.commit()
             logger.info("数据库初始化完成")
     
-    def get_channel_videos(self, channel_url: str, max_videos: int = 50, cookie_string: Optional[str] = None) -> List[Dict]:
+    def get_channel_videos(self, channel_url: str, max_videos: int = 50, cookie_string: Optional[str] = None,
+                           cookie_file: Optional[Path] = None) -> List[Dict]:
         """
         获取频道最新视频列表
         
@@ -85,152 +241,176 @@ class YouTubeChannelProcessor:
             channel_url: YouTube频道URL
             max_videos: 最大视频数量
             cookie_string: 可选的cookie字符串，自动转换为Netscape格式
+            cookie_file: 可选的已生成Cookie文件，传入时不再处理cookie_string
             
         Returns:
             视频信息列表
         """
-        # 配置yt-dlp选项
-        ydl_opts = {
-            'quiet': True,
-            'no_warnings': True,
-            # 不使用 extract_flat，获取完整的视频信息
-            'playlistend': max_videos,  # 限制视频数量
-        }
+        # 优先使用未过期的缓存列表
+        with self.get_db_connection() as conn:
+            row = conn.execute(
+                'SELECT payload_json, fetched_at FROM channel_list_cache WHERE url = ? AND max_videos = ?',
+                (channel_url, max_videos)
+            ).fetchone()
+        if row and time.time() - row[1] < CHANNEL_LIST_CACHE_TTL:
+            payload = json_utils.loads(row[0])
+            logger.info(f"使用缓存的频道视频列表（{len(payload['videos'])} 个视频）")
+            return payload['channel_info'], payload['videos']
         
-        # 处理Cookie
-        temp_cookie_file = None
-        if cookie_string:
-            # 使用传入的cookie字符串，转换为Netscape格式
-            temp_cookie_file = save_cookie_string_as_netscape(cookie_string)
-            ydl_opts['cookiefile'] = str(temp_cookie_file)
-            logger.info("使用传入的Cookie字符串（已转换为Netscape格式）")
-        else:
-            # 使用固定的cookie文件
-            cookie_path = COOKIE_DIR / "cookies.txt"
-            if cookie_path.exists():
-                ydl_opts['cookiefile'] = str(cookie_path)
-                logger.info("使用Cookie文件: cookies.txt")
-            else:
-                logger.warning("未找到 cookies.txt，可能会遇到访问限制")
+        # 配置yt-dlp选项
+        ydl_opts = dict(self._YDL_OPTS_LIST)
+        ydl_opts['playlist_items'] = f'1:{max_videos}'  # 限制视频数量
         
         def _flatten_entries(entries):
             """展开嵌套的 playlist，确保获取真实视频条目"""
             flat = []
-            queue = list(entries)
+            queue = deque(entries)
             while queue:
-                entry = queue.pop(0)
+                entry = queue.popleft()
                 if not entry:
                     continue
                 entry_type = entry.get('_type')
                 if entry_type == 'playlist' and entry.get('entries'):
-                    queue = entry['entries'] + queue
+                    # 子列表按原顺序放回队首，保持深度优先的展开顺序
+                    queue.extendleft(reversed(entry['entries']))
                     continue
                 flat.append(entry)
             return flat
 
-        try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(channel_url, download=False)
-                
-                if not info:
-                    raise ValueError("无法获取频道信息")
-                
-                # 获取频道信息
-                channel_info = {
-                    'channel_id': info.get('id', ''),
-                    'channel_name': info.get('title', ''),
-                    'channel_url': channel_url
-                }
-                
-                # 获取视频列表
-                videos = []
-                entries = _flatten_entries(info.get('entries', []))
-                
-                for entry in entries:
-                    if len(videos) >= max_videos:
-                        break
-                    if entry:
-                        entry_type = entry.get('_type')
-                        if entry_type and entry_type not in (None, 'url', 'video'):
-                            logger.debug(f"跳过非视频条目: type={entry_type}, title={entry.get('title', '')}")
-                            continue
-                        video_id = entry.get('id', '')
-                        raw_url = entry.get('url') or entry.get('webpage_url')
-                        if raw_url and ("watch?v=" in raw_url or "/shorts/" in raw_url):
-                            video_url = raw_url
-                        elif video_id and len(video_id) == 11:
-                            video_url = f"https://www.youtube.com/watch?v={video_id}"
-                        else:
-                            logger.warning(f"跳过无法识别的视频条目: id={video_id}, url={raw_url}")
-                            continue
-                        
-                        video_info = {
-                            'video_id': video_id,
-                            'title': entry.get('title', ''),
-                            'url': video_url,
-                            'duration': entry.get('duration'),
-                            'upload_date': entry.get('upload_date'),
-                            'uploader': entry.get('uploader') or channel_info['channel_name']
-                        }
-                        videos.append(video_info)
-                
-                logger.info(f"获取到 {len(videos)} 个视频")
-                return channel_info, videos
+        # 处理Cookie
+        with _resolved_cookie_file(cookie_string, cookie_file) as cookie_file:
+            if cookie_file:
+                ydl_opts['cookiefile'] = str(cookie_file)
+            else:
+                logger.warning("未找到 cookies.txt，可能会遇到访问限制")
+            
+            try:
+                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                    info = ydl.extract_info(_videos_tab_url(channel_url), download=False)
+                    
+                    if not info:
+                        raise ValueError("无法获取频道信息")
+                    
+                    # 获取频道信息
+                    channel_info = {
+                        # 标签页的 title 形如“频道名 - Videos”，优先使用 channel 字段
+                        'channel_id': info.get('channel_id') or info.get('id', ''),
+                        'channel_name': info.get('channel') or info.get('title', ''),
+                        'channel_url': channel_url
+                    }
+                    
+                    # 获取视频列表
+                    videos = []
+                    entries = _flatten_entries(info.get('entries', []))
+                    
+                    for entry in entries:
+                        if len(videos) >= max_videos:
+                            break
+                        if entry:
+                            entry_type = entry.get('_type')
+                            if entry_type and entry_type not in (None, 'url', 'video'):
+                                logger.debug(f"跳过非视频条目: type={entry_type}, title={entry.get('title', '')}")
+                                continue
+                            video_id = entry.get('id', '')
+                            raw_url = entry.get('url') or entry.get('webpage_url')
+                            if raw_url and ("watch?v=" in raw_url or "/shorts/" in raw_url):
+                                video_url = raw_url
+                            elif video_id and len(video_id) == 11:
+                                video_url = f"https://www.youtube.com/watch?v={video_id}"
+                            else:
+                                logger.warning(f"跳过无法识别的视频条目: id={video_id}, url={raw_url}")
+                                continue
+                            
+                            video_info = {
+                                'video_id': video_id,
+                                'title': entry.get('title', ''),
+                                'url': video_url,
+                                'duration': entry.get('duration'),
+                                'upload_date': entry.get('upload_date'),
+                                'uploader': entry.get('uploader') or channel_info['channel_name']
+                            }
+                            videos.append(video_info)
+                    
+                    logger.info(f"获取到 {len(videos)} 个视频")
+                    
+                    # 写入缓存
+                    with self.get_db_connection() as conn:
+                        conn.execute(
+                            'INSERT OR REPLACE INTO channel_list_cache (url, max_videos, fetched_at, payload_json) VALUES (?, ?, ?, ?)',
+                            (channel_url, max_videos, int(time.time()),
+                             json_utils.dumps({'channel_info': channel_info, 'videos': videos}))
+                        )
+                    
+                    return channel_info, videos
                 
-        except Exception as e:
-            logger.error(f"获取频道视频失败: {str(e)}")
-            raise
-        finally:
-            # 清理临时cookie文件
-            if temp_cookie_file and temp_cookie_file.exists():
-                temp_cookie_file.unlink()
+            except Exception as e:
+                logger.error(f"获取频道视频失败: {str(e)}")
+                raise
     
-    def save_channel_and_videos(self, channel_info: Dict, videos: List[Dict]):
+    def save_channel_and_videos(self, channel_info: Dict, videos: List[Dict], conn=None,
+                                processed_at: Optional[str] = None) -> Tuple[set, set]:
         """
         保存频道和视频信息到数据库
         
         Args:
             channel_info: 频道信息
             videos: 视频列表
+            conn: 可选的已打开数据库连接，未传入时自行打开
+            processed_at: 可选的处理时间字符串（批量处理时整批共用），未传入时取当前时间
+        
+        Returns:
+            (已提取字幕的视频ID集合, 近期确认没有字幕的视频ID集合)，与写入在同一个事务中查询
         """
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            
+        if conn is None:
+            with self.get_db_connection() as conn:
+                return self.save_channel_and_videos(channel_info, videos, conn, processed_at)
+        
+        # 预先构造所有视频行，一次 executemany 写入
+        video_rows = [
+            (
+                video['video_id'],
+                channel_info['channel_id'],
+                video['title'],
+                video['url'],
+                video['duration'],
+                video['upload_date'],
+                video['uploader'],
+                False,  # subtitle_extracted
+                None,   # subtitle_language
+                None    # subtitle_json
+            )
+            for video in videos
+        ]
+        
+        # 频道、全部视频以及已处理视频的查询在同一个写事务中完成，只提交一次
+        with _write_transaction(conn):
             # 保存或更新频道信息
-            cursor.execute('''
+            conn.execute('''
                 INSERT OR REPLACE INTO channels (channel_id, channel_name, channel_url, last_processed)
                 VALUES (?, ?, ?, ?)
             ''', (
                 channel_info['channel_id'],
                 channel_info['channel_name'],
                 channel_info['channel_url'],
-                datetime.now()
+                processed_at or datetime.now().isoformat(sep=' ', timespec='seconds')
             ))
             
             # 保存视频信息
-            for video in videos:
-                cursor.execute('''
-                    INSERT OR IGNORE INTO videos 
-                    (video_id, channel_id, title, url, duration, upload_date, uploader, subtitle_extracted, subtitle_language, subtitle_json)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    video['video_id'],
-                    channel_info['channel_id'],
-                    video['title'],
-                    video['url'],
-                    video['duration'],
-                    video['upload_date'],
-                    video['uploader'],
-                    False,  # subtitle_extracted
-                    None,   # subtitle_language
-                    None    # subtitle_json
-                ))
+            conn.executemany('''
+                INSERT OR IGNORE INTO videos
+                (video_id, channel_id, title, url, duration, upload_date, uploader, subtitle_extracted, subtitle_language, subtitle_json)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', video_rows)
             
-            conn.commit()
-            logger.info(f"保存了频道 '{channel_info['channel_name']}' 和 {len(videos)} 个视频")
+            processed = self._load_processed_sets(conn, channel_info['channel_id'])
+        
+        logger.info(f"保存了频道 '{channel_info['channel_name']}' 和 {len(videos)} 个视频")
+        return processed
     
     def extract_video_subtitles(self, video_id: str, video_url: str, 
-                              subtitle_lang: str = "en", cookie_string: Optional[str] = None) -> Optional[List[Dict]]:
+                              subtitle_lang: str = "en", cookie_string: Optional[str] = None,
+                              cookie_file: Optional[Path] = None,
+                              scratch_dir: Optional[Path] = None) -> Tuple[Optional[Dict], Dict]:
         """
         提取单个视频的字幕
         
@@ -239,168 +419,326 @@ class YouTubeChannelProcessor:
             video_url: 视频URL
             subtitle_lang: 字幕语言
             cookie_string: 可选的cookie字符串，自动转换为Netscape格式
+            cookie_file: 可选的已生成Cookie文件，传入时不再处理cookie_string
+            scratch_dir: 可选的共享临时目录（批量处理时复用），未传入时单独创建
             
         Returns:
-            字幕数据列表或None
+            (字幕数据, 视频元数据)；视频没有字幕时字幕数据为None
+            
+        Raises:
+            下载或解析出错时抛出异常（与“没有字幕”区分，调用方不应把它记为无字幕）
         """
-        temp_dir = Path(tempfile.mkdtemp(prefix="ytbscript_batch_"))
+        vtt_data, metadata = self.download_video_subtitles(video_id, video_url, subtitle_lang, cookie_string,
+                                                           cookie_file, scratch_dir)
+        if vtt_data is None:
+            return None, metadata
         
-        ydl_opts = {
-            'skip_download': True,
-            'writesubtitles': True,
-            'writeautomaticsub': True,
-            'subtitleslangs': [subtitle_lang],
-            'subtitlesformat': 'vtt',
-            'outtmpl': str(temp_dir / '%(title)s.%(ext)s'),
-            'quiet': True,
-            'no_warnings': True,
-        }
+        # 转换字幕为JSON格式
+        try:
+            subtitle_json = vtt_bytes_to_json(vtt_data)
+        except Exception as e:
+            logger.error(f"转换视频 {video_id} 字幕失败: {str(e)}")
+            raise
+        logger.info(f"视频 {video_id} 提取到 {len(subtitle_json)} 条字幕")
+        return {
+            'language': subtitle_lang,
+            'subtitles': subtitle_json
+        }, metadata
+    
+    def download_video_subtitles(self, video_id: str, video_url: str, 
+                                 subtitle_lang: str = "en", cookie_string: Optional[str] = None,
+                                 cookie_file: Optional[Path] = None,
+                                 scratch_dir: Optional[Path] = None) -> Tuple[Optional[bytes], Dict]:
+        """
+        下载单个视频的VTT字幕（只做网络部分，不解析）
         
-        # 处理Cookie
-        temp_cookie_file = None
-        if cookie_string:
-            # 使用传入的cookie字符串，转换为Netscape格式
-            temp_cookie_file = save_cookie_string_as_netscape(cookie_string)
-            ydl_opts['cookiefile'] = str(temp_cookie_file)
-        else:
-            # 使用固定的cookie文件
-            cookie_path = COOKIE_DIR / "cookies.txt"
-            if cookie_path.exists():
-                ydl_opts['cookiefile'] = str(cookie_path)
+        Args:
+            video_id: 视频ID
+            video_url: 视频URL
+            subtitle_lang: 字幕语言
+            cookie_string: 可选的cookie字符串，自动转换为Netscape格式
+            cookie_file: 可选的已生成Cookie文件，传入时不再处理cookie_string
+            scratch_dir: 可选的共享临时目录（批量处理时复用），未传入时单独创建
+            
+        Returns:
+            (VTT字幕文件内容, 视频元数据)；视频没有字幕时字幕内容为None。
+            元数据用于补全列表阶段缺失的上传日期和时长，由调用方随字幕一起写库
+            
+        Raises:
+            下载出错（网络、限流、Cookie失效等）时抛出异常
+        """
+        own_temp_dir = scratch_dir is None
+        temp_dir = Path(tempfile.mkdtemp(prefix="ytbscript_batch_")) if own_temp_dir else Path(scratch_dir)
         
-        try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(video_url, download=True)
-                
-                # 查找字幕文件
-                subtitle_files = list(temp_dir.glob('*.vtt'))
-                
-                if not subtitle_files:
-                    logger.warning(f"视频 {video_id} 没有找到字幕文件")
-                    return None
-                
-                # 转换字幕为JSON格式
-                subtitle_file = subtitle_files[0]  # 使用第一个字幕文件
-                try:
-                    subtitle_json = vtt_to_json(str(subtitle_file))
-                    logger.info(f"视频 {video_id} 提取到 {len(subtitle_json)} 条字幕")
-                    return {
-                        'language': subtitle_lang,
-                        'subtitles': subtitle_json
+        ydl_opts = dict(self._YDL_OPTS_EXTRACT)
+        ydl_opts['subtitleslangs'] = [subtitle_lang]
+        # 以视频ID命名，字幕文件路径可以直接确定
+        ydl_opts['outtmpl'] = str(temp_dir / f'{video_id}.%(ext)s')
+        
+        # 处理Cookie
+        with _resolved_cookie_file(cookie_string, cookie_file) as cookie_file:
+            if cookie_file:
+                ydl_opts['cookiefile'] = str(cookie_file)
+            
+            try:
+                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                    info = ydl.extract_info(video_url, download=True) or {}
+                    
+                    # 列表阶段只有精简信息，这里取出上传日期和时长供写库时补全
+                    metadata = {
+                        'upload_date': info.get('upload_date'),
+                        'duration': info.get('duration')
                     }
-                except Exception as e:
-                    logger.error(f"转换字幕失败 {subtitle_file}: {str(e)}")
-                    return None
+                    
+                    # 字幕文件名为 <video_id>.<语言>.vtt，语言代码与请求不一致时再按前缀查找
+                    subtitle_file = temp_dir / f'{video_id}.{subtitle_lang}.vtt'
+                    if not subtitle_file.exists():
+                        subtitle_file = next(temp_dir.glob(f'{glob.escape(video_id)}.*.vtt'), None)
+                    
+                    if subtitle_file is None:
+                        logger.warning(f"视频 {video_id} 没有找到字幕文件")
+                        return None, metadata
+                    
+                    return subtitle_file.read_bytes(), metadata
                 
-        except Exception as e:
-            logger.error(f"提取视频 {video_id} 字幕失败: {str(e)}")
-            return None
-        finally:
-            # 清理临时目录
-            if temp_dir.exists():
-                shutil.rmtree(temp_dir)
-            # 清理临时cookie文件
-            if temp_cookie_file and temp_cookie_file.exists():
-                temp_cookie_file.unlink()
+            except Exception as e:
+                logger.error(f"提取视频 {video_id} 字幕失败: {str(e)}")
+                raise
+            finally:
+                # 清理临时目录；共享目录只删除本视频的文件
+                if own_temp_dir:
+                    if temp_dir.exists():
+                        shutil.rmtree(temp_dir)
+                else:
+                    for leftover in temp_dir.glob(f'{glob.escape(video_id)}.*'):
+                        leftover.unlink()
     
-    def save_subtitles(self, subtitles_data: Dict, video_id: str):
+    def save_subtitles(self, subtitles_data: Dict, video_id: str, conn=None):
         """
         保存字幕JSON到数据库
         
         Args:
             subtitles_data: 字幕数据字典 {'language': 'en', 'subtitles': [...]}
             video_id: 视频ID
+            conn: 可选的已打开数据库连接，未传入时自行打开
         """
         if not subtitles_data:
             return
         
-        import json
+        if conn is None:
+            with self.get_db_connection() as conn:
+                return self.save_subtitles(subtitles_data, video_id, conn)
         
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            
-            # 更新视频的字幕信息
-            cursor.execute('''
+        # 更新视频的字幕信息（UPDATE 和 blob 写入在同一个事务中）
+        with _write_transaction(conn):
+            self._write_subtitle_blob(conn, video_id, subtitles_data['language'], subtitles_data['subtitles'])
+        
+        logger.info(f"保存了视频 {video_id} 的 {len(subtitles_data['subtitles'])} 条字幕到JSON字段")
+    
+    def _write_subtitle_blob(self, conn, video_id: str, language: str, subtitles: List[Dict]):
+        """
+        用增量 blob I/O 写入字幕JSON：先用 zeroblob 预留空间，再分块写入，
+        避免把整段字幕再作为绑定参数复制一份（不提交事务）
+        """
+        payload = json_utils.dumps_bytes(subtitles)
+        rows = conn.execute('''
+            UPDATE videos SET 
+                subtitle_extracted = TRUE,
+                subtitle_language = ?,
+                subtitle_json = NULL,
+                subtitle_blob = zeroblob(?)
+            WHERE video_id = ?
+            RETURNING id
+        ''', (language, len(payload), video_id)).fetchall()
+        if not rows:
+            return
+        
+        view = memoryview(payload)
+        with conn.blobopen('videos', 'subtitle_blob', rows[0][0]) as blob:
+            for start in range(0, len(view), SUBTITLE_BLOB_CHUNK_SIZE):
+                blob.write(view[start:start + SUBTITLE_BLOB_CHUNK_SIZE])
+    
+    def _load_processed_sets(self, conn, channel_id: str) -> Tuple[set, set]:
+        """查询频道下已经提取过字幕的视频ID集合，以及近期确认没有字幕的视频ID集合"""
+        extracted = set()
+        no_subtitles = set()
+        for video_id, subtitle_extracted in conn.execute(
+            '''SELECT video_id, subtitle_extracted FROM videos WHERE channel_id = ?
+               AND (subtitle_extracted = 1 OR (subtitle_status = 'none' AND subtitle_checked_at > ?))''',
+            (channel_id, int(time.time()) - NO_SUBTITLE_RECHECK_SECONDS)
+        ):
+            (extracted if subtitle_extracted else no_subtitles).add(video_id)
+        return extracted, no_subtitles
+    
+    def save_subtitles_batch(self, items: List[Tuple[str, Optional[Dict], Dict]], conn=None):
+        """
+        在一个事务中批量保存多个视频的字幕JSON
+        
+        Args:
+            items: [(video_id, subtitles_data, metadata), ...] 列表，subtitles_data 为 None 表示没有字幕，
+                   metadata 为下载时取得的上传日期和时长，用于补全列表阶段缺失的字段（已有值不覆盖）
+            conn: 可选的已打开数据库连接，未传入时自行打开
+        """
+        rows = [(video_id, data) for video_id, data, _ in items if data]
+        checked_at = int(time.time())
+        missing = [(checked_at, video_id) for video_id, data, _ in items if not data]
+        backfill = [
+            (metadata.get('upload_date'), metadata.get('duration'), video_id)
+            for video_id, _, metadata in items if metadata
+        ]
+        if not rows and not missing:
+            return
+        
+        if conn is None:
+            with self.get_db_connection() as conn:
+                return self.save_subtitles_batch(items, conn)
+        
+        with _write_transaction(conn):
+            for video_id, data in rows:
+                self._write_subtitle_blob(conn, video_id, data['language'], data['subtitles'])
+            # 记录没有字幕的视频，一段时间内不再重复下载
+            conn.executemany(
+                "UPDATE videos SET subtitle_status = 'none', subtitle_checked_at = ? WHERE video_id = ?",
+                missing
+            )
+            conn.executemany('''
                 UPDATE videos SET 
-                    subtitle_extracted = TRUE,
-                    subtitle_language = ?,
-                    subtitle_json = ?
+                    upload_date = COALESCE(upload_date, ?),
+                    duration = COALESCE(duration, ?)
                 WHERE video_id = ?
-            ''', (
-                subtitles_data['language'],
-                json.dumps(subtitles_data['subtitles'], ensure_ascii=False),
-                video_id
-            ))
-            
-            conn.commit()
-            logger.info(f"保存了视频 {video_id} 的 {len(subtitles_data['subtitles'])} 条字幕到JSON字段")
+            ''', backfill)
+        
+        logger.info(f"批量保存了 {len(rows)} 个视频的字幕到JSON字段，{len(missing)} 个视频没有字幕")
     
     async def process_channel_batch(self, channel_url: str, 
                                    max_videos: int = 50, subtitle_lang: str = "en", 
-                                   cookie_string: Optional[str] = None) -> Dict:
+                                   cookie_string: Optional[str] = None,
+                                   concurrency: int = DEFAULT_CONCURRENCY) -> Dict:
         """
-        批量处理频道视频（异步串行处理）
+        批量处理频道视频（多个工作协程并发提取字幕）
         
         Args:
             channel_url: YouTube频道URL
             max_videos: 最大视频数量
             subtitle_lang: 字幕语言
             cookie_string: 可选的cookie字符串，自动转换为Netscape格式
+            concurrency: 同时提取字幕的视频数
             
         Returns:
             处理结果统计
         """
-        start_time = datetime.now()
+        start_time = time.time()
+        # 整个批次共用一个处理时间字符串
+        processed_at = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(start_time))
         logger.info(f"开始批量处理频道: {channel_url}")
         
         try:
-            # 1. 获取频道视频列表
-            logger.info("正在获取频道视频列表...")
-            channel_info, videos = self.get_channel_videos(channel_url, max_videos, cookie_string)
-            
-            # 2. 保存频道和视频信息
-            self.save_channel_and_videos(channel_info, videos)
-            
-            # 3. 串行处理每个视频的字幕提取
-            success_count = 0
-            failed_count = 0
-            
-            logger.info(f"开始串行处理 {len(videos)} 个视频的字幕...")
-            
-            for i, video in enumerate(videos, 1):
-                logger.info(f"处理进度 {i}/{len(videos)}: {video['title'][:50]}...")
-                
-                # 检查是否已经提取过字幕
-                with sqlite3.connect(self.db_path) as conn:
-                    cursor = conn.cursor()
-                    cursor.execute('SELECT subtitle_extracted FROM videos WHERE video_id = ?', 
-                                 (video['video_id'],))
-                    result = cursor.fetchone()
-                    
-                    if result and result[0]:
-                        logger.info(f"视频 {video['video_id']} 字幕已存在，跳过")
-                        success_count += 1
-                        continue
-                
-                # 提取字幕
-                subtitles_data = self.extract_video_subtitles(
-                    video['video_id'], 
-                    video['url'], 
-                    subtitle_lang,
-                    cookie_string
+            # Cookie文件和临时目录整个批次只生成一次
+            with _resolved_cookie_file(cookie_string) as cookie_file, \
+                    tempfile.TemporaryDirectory(prefix="ytbscript_batch_") as scratch_dir:
+                # 1. 获取频道视频列表
+                logger.info("正在获取频道视频列表...")
+                channel_info, videos = await asyncio.to_thread(
+                    self.get_channel_videos, channel_url, max_videos, cookie_file=cookie_file
                 )
                 
-                if subtitles_data:
-                    self.save_subtitles(subtitles_data, video['video_id'])
-                    success_count += 1
-                else:
-                    failed_count += 1
-                
-                # 添加延迟避免请求过于频繁
-                await asyncio.sleep(2)
+                # 整个批次复用同一个数据库连接；数据库操作都放到线程中执行，
+                # 连接会跨线程使用（同一时刻只有一个操作在用）
+                conn = self.get_db_connection(check_same_thread=False)
+                try:
+                    # 2. 保存频道和视频信息，同一事务中查询出该频道已经处理过的视频
+                    already_extracted, no_subtitles = await asyncio.to_thread(
+                        self.save_channel_and_videos, channel_info, videos, conn, processed_at
+                    )
+                    
+                    # 3. 多个工作协程从队列中取视频并发提取字幕
+                    success_count = 0
+                    failed_count = 0
+                    
+                    queue: asyncio.Queue = asyncio.Queue()
+                    for i, video in enumerate(videos, 1):
+                        queue.put_nowait((i, video))
+                    
+                    async def worker():
+                        nonlocal success_count, failed_count
+                        while True:
+                            try:
+                                i, video = queue.get_nowait()
+                            except asyncio.QueueEmpty:
+                                return
+                            
+                            logger.info(f"处理进度 {i}/{len(videos)}: {video['title'][:50]}...")
+                            
+                            # 检查是否已经提取过字幕
+                            if video['video_id'] in already_extracted:
+                                logger.info(f"视频 {video['video_id']} 已处理过，跳过")
+                                success_count += 1
+                                continue
+                            
+                            # 近期确认没有字幕的视频不再下载，与首次检查时一样计为失败
+                            if video['video_id'] in no_subtitles:
+                                logger.info(f"视频 {video['video_id']} 近期已确认没有字幕，跳过")
+                                failed_count += 1
+                                continue
+                            
+                            # 令牌桶限速：允许短时突发，超出速率时才等待
+                            try:
+                                async with get_youtube_limiter():
+                                    # 在线程中提取字幕，避免阻塞事件循环
+                                    subtitles_data, metadata = await asyncio.to_thread(
+                                        self.extract_video_subtitles,
+                                        video['video_id'], 
+                                        video['url'], 
+                                        subtitle_lang,
+                                        cookie_file=cookie_file,
+                                        scratch_dir=Path(scratch_dir)
+                                    )
+                            except Exception:
+                                # 下载或解析出错，不记为无字幕，下次运行重试
+                                failed_count += 1
+                                continue
+                            
+                            # 确认没有字幕时也入队，由写库协程记录下来
+                            write_queue.put_nowait((video['video_id'], subtitles_data, metadata))
+                            if subtitles_data:
+                                success_count += 1
+                            else:
+                                failed_count += 1
+                    
+                    # 单独的写库协程：攒批后在一个事务中写入，工作协程只负责入队
+                    write_queue: asyncio.Queue = asyncio.Queue()
+                    
+                    async def writer():
+                        finished = False
+                        while not finished:
+                            item = await write_queue.get()
+                            if item is None:
+                                return
+                            batch = [item]
+                            while len(batch) < SUBTITLE_WRITE_BATCH_SIZE:
+                                try:
+                                    item = await asyncio.wait_for(write_queue.get(), SUBTITLE_WRITE_WAIT_SECONDS)
+                                except asyncio.TimeoutError:
+                                    break
+                                if item is None:
+                                    finished = True
+                                    break
+                                batch.append(item)
+                            await asyncio.to_thread(self.save_subtitles_batch, batch, conn)
+                    
+                    logger.info(f"开始处理 {len(videos)} 个视频的字幕（并发数 {concurrency}）...")
+                    writer_task = asyncio.create_task(writer())
+                    try:
+                        await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+                    finally:
+                        # 结束标记，写库协程写完剩余字幕后退出
+                        write_queue.put_nowait(None)
+                        await writer_task
+                finally:
+                    conn.close()
             
-            end_time = datetime.now()
-            duration = (end_time - start_time).total_seconds()
+            end_time = time.time()
+            duration = end_time - start_time
             
             result = {
                 'status': 'completed',
@@ -409,7 +747,7 @@ class YouTubeChannelProcessor:
                 'success_count': success_count,
                 'failed_count': failed_count,
                 'duration_seconds': duration,
-                'processed_at': end_time.isoformat()
+                'processed_at': datetime.fromtimestamp(end_time).isoformat()
             }
             
             logger.info(f"批量处理完成: 成功 {success_count}, 失败 {failed_count}, 耗时 {duration:.1f}秒")
@@ -419,10 +757,17 @@ class YouTubeChannelProcessor:
             logger.error(f"批量处理失败: {str(e)}")
             raise
     
-    def get_db_connection(self):
-        """获取数据库连接"""
-        import sqlite3
-        return sqlite3.connect(self.db_path)
+    def get_db_connection(self, check_same_thread: bool = True):
+        """
+        获取数据库连接，并应用连接级别的 PRAGMA
+        
+        连接为自动提交模式（isolation_level=None），只读查询不会隐式开启事务；
+        多条写入需要用 _write_transaction 显式包成一个事务
+        """
+        conn = sqlite3.connect(self.db_path, check_same_thread=check_same_thread, isolation_level=None)
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
     
     def get_channel_stats(self, channel_id: str = None) -> Dict:
         """
@@ -434,52 +779,16 @@ class YouTubeChannelProcessor:
         Returns:
             统计信息
         """
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        with self.get_db_connection() as conn:
+            conn.row_factory = sqlite3.Row
             
             if channel_id:
                 # 单个频道统计
-                cursor.execute('''
-                    SELECT 
-                        c.channel_name,
-                        c.channel_url,
-                        c.last_processed,
-                        COUNT(v.id) as total_videos,
-                        SUM(CASE WHEN v.subtitle_extracted THEN 1 ELSE 0 END) as videos_with_subtitles
-                    FROM channels c
-                    LEFT JOIN videos v ON c.channel_id = v.channel_id
-                    WHERE c.channel_id = ?
-                    GROUP BY c.channel_id
-                ''', (channel_id,))
-                
-                result = cursor.fetchone()
-                if result:
-                    return {
-                        'channel_name': result[0],
-                        'channel_url': result[1],
-                        'last_processed': result[2],
-                        'total_videos': result[3],
-                        'videos_with_subtitles': result[4]
-                    }
-                else:
-                    return {}
+                row = conn.execute(_CHANNEL_STATS_SQL, (channel_id,)).fetchone()
+                return dict(row) if row else {}
             else:
                 # 所有频道统计
-                cursor.execute('''
-                    SELECT 
-                        COUNT(DISTINCT c.channel_id) as total_channels,
-                        COUNT(v.id) as total_videos,
-                        SUM(CASE WHEN v.subtitle_extracted THEN 1 ELSE 0 END) as videos_with_subtitles
-                    FROM channels c
-                    LEFT JOIN videos v ON c.channel_id = v.channel_id
-                ''')
-                
-                result = cursor.fetchone()
-                return {
-                    'total_channels': result[0] or 0,
-                    'total_videos': result[1] or 0,
-                    'videos_with_subtitles': result[2] or 0
-                }
+                return dict(conn.execute(_ALL_CHANNELS_STATS_SQL).fetchone())
 
 
 # 全局处理器实例，供FastAPI使用